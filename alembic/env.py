@@ -19,7 +19,7 @@ if config.config_file_name is not None:
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from app.db.base import Base
-from app.models import user, address  # IMPORTANT: import models
+from app.models import user, address, audit_event  # IMPORTANT: import models
 
 target_metadata = Base.metadata
 
@@ -0,0 +1,31 @@
+"""add version to users
+
+Revision ID: 3a7c9e1f5b62
+Revises: 8d4f3a6b2e17
+Create Date: 2026-10-18 15:20:11.482907
+
+Every write to a user increases 'version' by one. It is the basis of the ETags
+of user resources (see app/core/etags.py). Existing rows start at version 1.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a7c9e1f5b62'
+down_revision: Union[str, Sequence[str], None] = '8d4f3a6b2e17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A constant server default lets PostgreSQL add the column without rewriting the table
+    op.add_column('users', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'version')
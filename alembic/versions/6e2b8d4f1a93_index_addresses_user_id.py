@@ -0,0 +1,37 @@
+"""index addresses user_id
+
+Revision ID: 6e2b8d4f1a93
+Revises: 3a7c9e1f5b62
+Create Date: 2026-10-18 17:41:52.903146
+
+The foreign key 'addresses.user_id' had no index, so loading the addresses of a
+page of users ('?include=addresses', WHERE user_id = ANY(...)) scanned the whole
+table. The index is built CONCURRENTLY, which does not block writes to 'addresses'
+(and therefore has to run outside a transaction).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e2b8d4f1a93'
+down_revision: Union[str, Sequence[str], None] = '3a7c9e1f5b62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f('ix_addresses_user_id'), 'addresses', ['user_id'],
+            unique=False, postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_addresses_user_id'), table_name='addresses', postgresql_concurrently=True)
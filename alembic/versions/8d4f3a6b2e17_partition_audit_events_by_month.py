@@ -0,0 +1,106 @@
+"""partition audit events by month
+
+Revision ID: 8d4f3a6b2e17
+Revises: 5b1e7d2c9a40
+Create Date: 2026-10-18 11:02:37.604119
+
+Turns 'audit_events' into a table range-partitioned on 'created_at', with one
+partition per calendar month (UTC). Existing rows are copied across and the ID
+sequence is kept, so IDs keep counting up. Future partitions are created (and
+expired ones dropped) by the app, see app/db/partitions.py.
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4f3a6b2e17'
+down_revision: Union[str, Sequence[str], None] = '5b1e7d2c9a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Partitions created ahead of the current month by this migration
+MONTHS_AHEAD = 3
+
+
+def _add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+
+    # 1. Move the plain table out of the way (its ID sequence must survive the DROP below)
+    op.execute("ALTER SEQUENCE audit_events_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE audit_events RENAME TO audit_events_unpartitioned")
+    op.execute("ALTER TABLE audit_events_unpartitioned RENAME CONSTRAINT audit_events_pkey TO audit_events_unpartitioned_pkey")
+
+    # 2. The partitioned parent. A primary key on a partitioned table must include
+    #    the partition key, hence (id, created_at).
+    op.execute("""
+        CREATE TABLE audit_events (
+            id BIGINT NOT NULL DEFAULT nextval('audit_events_id_seq'),
+            created_at TIMESTAMPTZ NOT NULL,
+            action VARCHAR NOT NULL,
+            actor VARCHAR,
+            details VARCHAR NOT NULL,
+            CONSTRAINT audit_events_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE audit_events_id_seq OWNED BY audit_events.id")
+
+    # 3. Indexes on the parent are created on every partition automatically.
+    #    BRIN is tiny and ideal for time ranges on append-only data;
+    #    the compound index answers "what did actor X do (action Y) in period Z".
+    op.create_index('ix_audit_events_created_at_brin', 'audit_events', ['created_at'], postgresql_using='brin')
+    op.create_index('ix_audit_events_actor_action_created_at', 'audit_events', ['actor', 'action', 'created_at'])
+
+    # 4. One partition per month, from the oldest existing event up to a few months ahead
+    now = datetime.now(timezone.utc)
+    oldest = bind.execute(sa.text("SELECT min(created_at) FROM audit_events_unpartitioned")).scalar() or now
+    month = oldest.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last = _add_months(now.replace(day=1, hour=0, minute=0, second=0, microsecond=0), MONTHS_AHEAD)
+    while month <= last:
+        upper = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE audit_events_y{month:%Y}m{month:%m} PARTITION OF audit_events "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        month = upper
+
+    # 5. Copy the existing events, then drop the old table
+    op.execute("""
+        INSERT INTO audit_events (id, created_at, action, actor, details)
+        SELECT id, created_at, action, actor, details FROM audit_events_unpartitioned
+    """)
+    op.drop_table('audit_events_unpartitioned')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER SEQUENCE audit_events_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE audit_events RENAME TO audit_events_partitioned")
+    op.execute("ALTER TABLE audit_events_partitioned RENAME CONSTRAINT audit_events_pkey TO audit_events_partitioned_pkey")
+
+    op.execute("""
+        CREATE TABLE audit_events (
+            id BIGINT NOT NULL DEFAULT nextval('audit_events_id_seq'),
+            created_at TIMESTAMPTZ NOT NULL,
+            action VARCHAR NOT NULL,
+            actor VARCHAR,
+            details VARCHAR NOT NULL,
+            CONSTRAINT audit_events_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE audit_events_id_seq OWNED BY audit_events.id")
+    op.execute("""
+        INSERT INTO audit_events (id, created_at, action, actor, details)
+        SELECT id, created_at, action, actor, details FROM audit_events_partitioned
+    """)
+    # Dropping the parent drops every partition (and the indexes) with it
+    op.drop_table('audit_events_partitioned')
@@ -0,0 +1,33 @@
+"""add default audit partition
+
+Revision ID: b4c8e2a7d519
+Revises: 6e2b8d4f1a93
+Create Date: 2026-10-18 19:12:08.331472
+
+An audit event whose month has no partition (e.g. one replayed from the spill file
+after its month was dropped) could not be inserted at all and was lost. The DEFAULT
+partition takes every such row instead; app/db/partitions.py moves rows out of it
+when their month's partition is created, and deletes rows older than the retention.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4c8e2a7d519'
+down_revision: Union[str, Sequence[str], None] = '6e2b8d4f1a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE TABLE audit_events_default PARTITION OF audit_events DEFAULT")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Events still held here have no monthly partition to go to and are deleted
+    op.execute("DROP TABLE audit_events_default")
@@ -0,0 +1,130 @@
+# This module provides the in-process cache used by the service layer.
+# Hot lookups (like "get user #5") are answered from memory when possible,
+# and every write to a user removes the stale copy ("invalidation").
+
+# 'time.monotonic' is a clock that never jumps backwards (unlike the wall clock),
+# which makes it the right tool for measuring TTLs.
+import time
+# 'OrderedDict' remembers insertion order, which gives us "least recently used" for free.
+from collections import OrderedDict
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge
+from app.core.singleflight import reads
+from app.core.response_cache import response_cache
+
+# Returned by 'get' when a key is not cached at all.
+# This is different from a cached 'None', which means "we know this does not exist".
+MISSING = object()
+
+# --- Metrics (rendered on GET /metrics) ---
+CACHE_HITS = Counter("app_cache_hits_total", "Cache lookups answered from memory.", ("cache",))
+CACHE_MISSES = Counter("app_cache_misses_total", "Cache lookups that had to go to the database.", ("cache",))
+CACHE_EVICTIONS = Counter("app_cache_evictions_total", "Entries dropped because the cache was full.", ("cache",))
+CACHE_ENTRIES = Gauge("app_cache_entries", "Entries currently held in the cache.", ("cache",))
+
+
+class CacheBackend:
+    """
+    The interface every cache store implements.
+    To use another store (e.g. Redis), subclass this and assign an instance
+    to 'user_cache' in this module at startup.
+    """
+
+    async def get(self, key):
+        """ Return the cached value, None for a cached "not found", or MISSING. """
+        raise NotImplementedError
+
+    async def set(self, key, value, ttl: float | None = None):
+        """ Store a value for 'ttl' seconds (the backend default when None). """
+        raise NotImplementedError
+
+    async def delete(self, key):
+        """ Forget a key, if present. """
+        raise NotImplementedError
+
+    async def clear(self):
+        """ Forget everything. """
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """ A size-bounded, TTL-based, least-recently-used cache living in this process. """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (expires_at, value); the first item is the least recently used one
+        self._data = OrderedDict()
+
+    async def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            CACHE_MISSES.inc(cache=self.name)
+            return MISSING
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            # Too old: drop it and treat it as a miss
+            del self._data[key]
+            CACHE_ENTRIES.set(len(self._data), cache=self.name)
+            CACHE_MISSES.inc(cache=self.name)
+            return MISSING
+
+        # Mark as "recently used" so it is the last candidate for eviction
+        self._data.move_to_end(key)
+        CACHE_HITS.inc(cache=self.name)
+        return value
+
+    async def set(self, key, value, ttl: float | None = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+
+        # Over the size limit: drop the least recently used entries
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            CACHE_EVICTIONS.inc(cache=self.name)
+        CACHE_ENTRIES.set(len(self._data), cache=self.name)
+
+    async def delete(self, key):
+        if self._data.pop(key, None) is not None:
+            CACHE_ENTRIES.set(len(self._data), cache=self.name)
+
+    async def clear(self):
+        self._data.clear()
+        CACHE_ENTRIES.set(0, cache=self.name)
+
+
+# The cache for single-user lookups (user_service.get_user_by_id), keyed by user ID.
+user_cache: CacheBackend = LRUCache(
+    "user",
+    maxsize=settings.user_cache_size,
+    ttl=settings.user_cache_ttl_seconds,
+)
+
+# The cache of authenticated users (get_current_user), keyed by user ID.
+# Kept short-lived so that role changes are picked up quickly.
+principal_cache: CacheBackend = LRUCache(
+    "principal",
+    maxsize=settings.principal_cache_size,
+    ttl=settings.principal_cache_ttl_seconds,
+)
+
+
+async def invalidate_user(user_id: int):
+    """ Drop every cached copy of a user. Call this after any write to that user. """
+
+    await user_cache.delete(user_id)
+    # Also forget the authenticated identity, so a changed role or deleted account
+    # is noticed on the very next request
+    await principal_cache.delete(user_id)
+    # Reads that are still running started before the write; new requests must not
+    # join them: this user (whatever fields it selects) and every page of the user list
+    reads.forget(("users.get_user", user_id))
+    reads.forget(("users_raw.get_user", user_id))
+    reads.forget(("users.list",))
+    reads.forget(("users_raw.list",))
+    # Cached HTTP responses: this user's own, and every page of the user list
+    response_cache.purge_tags(f"user:{user_id}", "users")
@@ -0,0 +1,245 @@
+# This module gives every request a deadline: a moment after which nobody is waiting
+# for the answer any more, so the work (and the database connection it holds) should stop.
+#
+#   - DeadlineMiddleware starts the clock: 'request_timeout_seconds' by default, or what the
+#     client asks for in the 'X-Request-Timeout' header (never more than the maximum).
+#   - Routes can choose their own default with 'Depends(deadline(seconds))', or opt out
+#     with 'Depends(no_deadline)' (e.g. long streaming exports).
+#   - Every database transaction starts with 'SET LOCAL statement_timeout' set to the time
+#     that is left, so PostgreSQL itself stops a query that would miss the deadline.
+#   - If the deadline passes, or the client disconnects, the request is cancelled
+#     (which also cancels its running query) and a 504 is returned right away.
+
+import asyncio
+from contextvars import ContextVar
+from time import monotonic
+
+from starlette.responses import JSONResponse, Response
+
+from app.core.config import settings
+from app.core.metrics import Counter
+
+REQUESTS_TIMED_OUT = Counter("app_requests_timed_out_total", "Requests stopped because their deadline passed.")
+REQUESTS_DISCONNECTED = Counter(
+    "app_requests_client_disconnected_total",
+    "Requests cancelled because the client disconnected before the response was sent.",
+)
+
+# "Client Closed Request" (a convention from nginx): recorded for requests whose client left.
+# Nobody receives it, but outer middleware (logging, metrics) still sees a complete response.
+CLIENT_CLOSED_REQUEST = 499
+
+# Request bodies larger than this are not read ahead (see DeadlineMiddleware), so uploads
+# keep their normal back-pressure; such requests are only cancelled by the deadline.
+DISCONNECT_WATCH_MAX_BODY = 1024 * 1024
+
+
+class DeadlineExceeded(Exception):
+    """ The request's deadline has passed; there is no point in starting more work. """
+
+
+class Deadline:
+    """ The deadline of one request. Routes may change it while the request runs. """
+
+    def __init__(self, seconds: float | None, client_seconds: float | None = None):
+        self.started_at = monotonic()
+        # A timeout the client asked for wins over the route's default (within the maximum)
+        self.client_seconds = client_seconds
+        self.expires_at = None
+        # Set whenever the deadline changes, so the middleware re-arms its timer
+        self.changed = asyncio.Event()
+        self.set(seconds)
+
+    def set(self, seconds: float | None):
+        """ Use 'seconds' (counted from the start of the request) as the route's default; None = no deadline. """
+
+        if seconds is not None and self.client_seconds is not None:
+            seconds = self.client_seconds
+        if seconds is not None:
+            seconds = min(seconds, settings.request_timeout_max_seconds)
+        self.expires_at = None if seconds is None else self.started_at + seconds
+        self.changed.set()
+
+    def remaining(self) -> float | None:
+        """ Seconds left (may be negative), or None without a deadline. """
+
+        return None if self.expires_at is None else self.expires_at - monotonic()
+
+
+# The deadline of the request being handled (None outside a request, e.g. background tasks)
+deadline_var: ContextVar[Deadline | None] = ContextVar("deadline", default=None)
+
+
+def remaining() -> float | None:
+    """ Seconds left for the current request, or None if it has no deadline. Raises DeadlineExceeded. """
+
+    current = deadline_var.get()
+    if current is None or current.expires_at is None:
+        return None
+    left = current.remaining()
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left
+
+
+def deadline_passed() -> bool:
+    """ True if the current request has a deadline and it has passed. """
+
+    current = deadline_var.get()
+    return current is not None and current.expires_at is not None and current.remaining() <= 0
+
+
+def statement_timeout_ms() -> int | None:
+    """ The time left as a PostgreSQL 'statement_timeout' (milliseconds, at least 1). """
+
+    left = remaining()
+    return None if left is None else max(1, int(left * 1000))
+
+
+# --- Route dependencies ---
+def deadline(seconds: float):
+    """ Dependency: give this route its own default deadline, e.g. Depends(deadline(2)). """
+
+    def apply_deadline():
+        current = deadline_var.get()
+        if current is not None:
+            current.set(seconds)
+
+    return apply_deadline
+
+
+def no_deadline():
+    """ Dependency: this route may run as long as it needs (e.g. streaming exports). """
+
+    current = deadline_var.get()
+    if current is not None:
+        current.set(None)
+
+
+def _client_timeout(scope) -> float | None:
+    """ The 'X-Request-Timeout' header (seconds), if present and valid. """
+
+    header = settings.request_timeout_header.lower().encode()
+    for name, value in scope["headers"]:
+        if name == header:
+            try:
+                seconds = float(value)
+            except ValueError:
+                return None
+            return seconds if seconds > 0 else None
+    return None
+
+
+def _watch_disconnect(scope) -> bool:
+    """ Whether the request body is small enough to be read ahead while the route runs. """
+
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            return value.isdigit() and int(value) <= DISCONNECT_WATCH_MAX_BODY
+        if name == b"transfer-encoding":
+            return False
+    return True
+
+
+class DeadlineMiddleware:
+    """ Runs each request against its deadline and stops it early on timeout or client disconnect. """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        current = Deadline(settings.request_timeout_seconds, client_seconds=_client_timeout(scope))
+        deadline_var.set(current)
+        response_started = False
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        # To notice a disconnect while the route is still working, we must be the ones
+        # waiting on 'receive'. Messages for the app are passed on through a queue.
+        watch = _watch_disconnect(scope)
+        messages = asyncio.Queue()
+        disconnected = asyncio.Event()
+
+        async def read_ahead():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        # The request runs in its own task (it inherits 'deadline_var'), so it can be cancelled
+        app_task = asyncio.create_task(self.app(scope, messages.get if watch else receive, send_wrapper))
+        reader = asyncio.create_task(read_ahead()) if watch else None
+        disconnect_waiter = asyncio.create_task(disconnected.wait())
+        timed_out = False
+
+        try:
+            while True:
+                current.changed.clear()
+                changed_waiter = asyncio.create_task(current.changed.wait())
+                left = current.remaining()
+                done, _ = await asyncio.wait(
+                    {app_task, disconnect_waiter, changed_waiter},
+                    timeout=None if left is None else max(0.0, left),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                changed_waiter.cancel()
+
+                if app_task in done:
+                    break
+                if disconnect_waiter in done:
+                    # Nobody is listening any more: stop the work and free the connection
+                    REQUESTS_DISCONNECTED.inc()
+                    app_task.cancel()
+                    break
+                if changed_waiter in done:
+                    # A route changed its deadline: wait again with the new one
+                    continue
+                left = current.remaining()
+                if left is not None and left <= 0:
+                    REQUESTS_TIMED_OUT.inc()
+                    timed_out = True
+                    app_task.cancel()
+                    break
+        except asyncio.CancelledError:
+            # The server is cancelling us (e.g. shutting down): take the request with us
+            app_task.cancel()
+            raise
+        finally:
+            disconnect_waiter.cancel()
+            if reader is not None:
+                reader.cancel()
+
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            # Expected after we cancelled it; anything else is a real cancellation
+            if not (timed_out or disconnected.is_set()):
+                raise
+
+        # Answer quickly, unless the response had already begun
+        if response_started:
+            return
+        if timed_out:
+            await _timeout_response()(scope, receive, send)
+        elif disconnected.is_set() and app_task.cancelled():
+            await Response(status_code=CLIENT_CLOSED_REQUEST)(scope, receive, send)
+
+
+def _timeout_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=504,
+        content={
+            "success": False,
+            "message": "The request took too long and was stopped"
+        }
+    )
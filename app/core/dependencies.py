@@ -17,10 +17,17 @@ from app.db.session import get_db
 
 # The User database model
 from app.models.user import User
+# The lightweight "who is calling" object returned by get_current_user
+from app.schemas.user_response import CurrentUser
 
 # This module provides JWT configuration constants.
 from app.core.security import SECRET_KEY, ALGORITHM
 
+# The in-memory cache of authenticated users, and auth-related settings
+from app.core import cache
+from app.core.cache import MISSING
+from app.core.config import settings
+
 # Reads token from: Authorization: Bearer <token>
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
@@ -29,9 +36,9 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 async def get_current_user(
     # The token is passed in from the OAuth2 scheme, OAuth2_scheme reads it from the request header.
     token: str = Depends(oauth2_scheme),
-    #
+    # The session only opens a real connection if we end up querying the database.
     db: AsyncSession = Depends(get_db)
-): # Get the DB session
+) -> CurrentUser: # Get the DB session
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -41,23 +48,33 @@ async def get_current_user(
     try:
         # Decode the JWT token to get the payload
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str | None = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
+        user_id = int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
+        # Bad signature, expired token, or a missing / non-numeric 'sub'
         raise credentials_exception
-   
-   # Look up the user in the database
+
+    # 1. Optional: trust the signed claims completely (no database work at all).
+    #    The signature proves we issued these values ourselves at login time.
+    if settings.auth_trust_token_claims and "username" in payload and "role" in payload:
+        return CurrentUser(id=user_id, username=payload["username"], role=payload["role"])
+
+    # 2. Recently seen user? Answer from memory.
+    cached = await cache.principal_cache.get(user_id)
+    if cached is not MISSING and cached is not None:
+        return cached
+
+    # 3. Look up the user in the database (only the columns authorization needs)
     result = await db.execute(
-        select(User).where(User.id == int(user_id))
+        select(User.id, User.username, User.role).where(User.id == user_id)
     )
+    row = result.mappings().one_or_none()
 
-    user = result.scalar_one_or_none()
-
-    if user is None:
+    if row is None:
         raise credentials_exception
 
-    return user
+    current_user = CurrentUser(**row)
+    await cache.principal_cache.set(user_id, current_user)
+    return current_user
 
 
 # This dependency ensures that the current user has the required role.
@@ -65,7 +82,7 @@ async def get_current_user(
 def require_role(required_role: str):
     # This inner function checks the user's role.
     # 'current_user' is injected via the 'get_current_user' dependency.
-    def role_checker(current_user: User = Depends(get_current_user)):
+    def role_checker(current_user: CurrentUser = Depends(get_current_user)):
         if current_user.role != required_role:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
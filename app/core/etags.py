@@ -0,0 +1,76 @@
+# This module implements HTTP conditional requests for user resources.
+#
+# Every user row has a 'version' that each write increases by one, so
+# '"<id>-<version>"' is a strong ETag: it changes exactly when the user changes.
+#
+#   - GET with 'If-None-Match: <etag>' -> 304 Not Modified (no body) if nothing changed,
+#     so polling clients stop re-downloading identical data
+#   - PUT/DELETE with 'If-Match: <etag>' -> the write only happens if the user is still
+#     at that version, otherwise 412 Precondition Failed ("optimistic concurrency":
+#     two clients editing the same user can no longer silently overwrite each other)
+
+import hashlib
+
+
+def user_etag(user_id: int, version: int) -> str:
+    """ The strong ETag of one user, e.g. '"42-3"'. """
+
+    return f'"{user_id}-{version}"'
+
+
+def page_etag(page: dict) -> str:
+    """ A strong ETag for one page of users: changes if any user on it (or the page itself) changes. """
+
+    digest = hashlib.sha1()
+    for user in page["items"]:
+        # Model objects, or plain row dicts (the fast read path)
+        if isinstance(user, dict):
+            digest.update(f"{user['id']}-{user['version']},".encode())
+        else:
+            digest.update(f"{user.id}-{user.version},".encode())
+    digest.update(f"{page['next_cursor']}|{page['estimated_total']}".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def content_etag(body: bytes) -> str:
+    """ A strong ETag for any encoded response body (e.g. one with only some fields). """
+
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def _entity_tags(header: str) -> list[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def none_match(if_none_match: str | None, etag: str) -> bool:
+    """ True if the client's 'If-None-Match' header lists 'etag' (it already has this version). """
+
+    if not if_none_match:
+        return False
+    # GET uses the "weak comparison": a 'W/' prefix on the client's tag is ignored
+    for tag in _entity_tags(if_none_match):
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def expected_versions(if_match: str | None, user_id: int) -> list[int] | None:
+    """
+    The user versions an 'If-Match' header accepts.
+    None means "any version" (no header, or '*'). Tags that are weak, malformed or
+    belong to another user accept nothing, so the write fails with 412.
+    """
+
+    if not if_match:
+        return None
+    versions = []
+    for tag in _entity_tags(if_match):
+        if tag == "*":
+            return None
+        # Writes use the "strong comparison": weak tags ('W/"..."') never match
+        if not (tag.startswith('"') and tag.endswith('"')):
+            continue
+        tag_user_id, _, version = tag[1:-1].partition("-")
+        if tag_user_id == str(user_id) and version.isdigit():
+            versions.append(int(version))
+    return versions
@@ -0,0 +1,109 @@
+# This module sets up structured (JSON) logging that never blocks a request.
+#
+# Request code only calls 'logger.info(...)': the record is put on an in-memory queue
+# (QueueHandler), and a background thread (QueueListener) formats it as one JSON
+# line and writes it to stdout. Slow terminals or log collectors therefore cannot
+# slow down responses. If the queue is full, records are dropped (and counted)
+# rather than making requests wait.
+
+import json
+import logging
+import queue
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from app.core.config import settings
+from app.core.metrics import Counter
+
+# The ID of the request being handled, so every log line it causes can be correlated.
+# A ContextVar is "per request": concurrent requests each see their own value.
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+LOGS_DROPPED = Counter("app_log_records_dropped_total", "Log records dropped because the log queue was full.")
+
+# Attributes every LogRecord has; anything else was passed via 'extra=' and is logged as a field.
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """ Render a record as one JSON object per line. """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        # Fields passed with 'extra={...}' (e.g. method, path, status)
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestQueueHandler(QueueHandler):
+    """ Queue records without blocking; tag each one with the current request ID. """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Runs in the request's own context, so this is the right request ID
+        # (unless the caller passed one explicitly with 'extra=').
+        # The record stays in this process, so no copying or pre-formatting is needed;
+        # the listener thread does the (comparatively slow) JSON formatting.
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOGS_DROPPED.inc()
+
+
+# The queue and background writer; created by 'start_logging'
+_listener: QueueListener | None = None
+
+
+def start_logging():
+    """ Route every 'app.*' logger through the queue to a JSON stdout writer (called at startup). """
+
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=settings.log_queue_size)
+
+    # The writer side: runs in the listener's own thread
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+    # The request side: only enqueues
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(settings.log_level.upper())
+    app_logger.addHandler(RequestQueueHandler(log_queue))
+    # Do not pass records on to the root logger as well (that would print them twice)
+    app_logger.propagate = False
+
+
+def stop_logging():
+    """ Write out everything still queued and stop the writer thread (called at shutdown). """
+
+    global _listener
+    if _listener is None:
+        return
+    # 'stop' waits until the queue has been processed
+    _listener.stop()
+    _listener = None
+
+    app_logger = logging.getLogger("app")
+    for handler in list(app_logger.handlers):
+        if isinstance(handler, RequestQueueHandler):
+            app_logger.removeHandler(handler)
+    app_logger.propagate = True
@@ -0,0 +1,129 @@
+# This module is a tiny, dependency-free metrics registry.
+# Other modules create counters/gauges here and update them as things happen;
+# GET /metrics then renders all of them in the Prometheus text format,
+# so any Prometheus-compatible scraper can collect them.
+
+# 'bisect' finds the right histogram bucket for a value with a binary search.
+from bisect import bisect_left
+from threading import Lock
+
+# Every metric created through this module registers itself here.
+REGISTRY = []
+
+
+def _format_labels(labelnames: tuple, labelvalues: tuple) -> str:
+    """ Render labels as {name="value",...}, escaping characters Prometheus treats specially. """
+
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, labelvalues):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """ A value that only goes up (e.g. number of cache hits). """
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # One value per combination of label values, e.g. ("user",) -> 42
+        self._values = {}
+        # Sync routes run in worker threads, so updates must not interleave
+        self._lock = Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """ A value that can go up and down (e.g. current number of cached entries). """
+
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Counter):
+    """ Counts observations (e.g. durations in seconds) into fixed buckets. """
+
+    metric_type = "histogram"
+
+    # Upper bounds in seconds, from 1 ms to 10 s.
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        # Each observation lands in exactly one bucket (the last slot is "+Inf");
+        # the cumulative counts Prometheus expects are computed when rendering.
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts, sum of values]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def collect(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        for labelvalues, counts, total in items:
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ("le",), labelvalues + (upper_bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def generate_latest() -> str:
+    """ Render every registered metric in the Prometheus text exposition format. """
+
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,78 @@
+# This module holds the helpers for "keyset" (a.k.a. cursor) pagination.
+# Instead of OFFSET (which makes the database walk and throw away rows),
+# every page remembers the sort key of its LAST row, and the next page simply
+# asks for rows "after" that key. This costs the same for page 1 and page 10,000.
+
+# 'base64' and 'json' are used to turn the cursor into an opaque, URL-safe string.
+import base64
+import json
+from datetime import datetime
+
+# Default and maximum page sizes shared by the ORM and raw SQL back ends.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(values: dict) -> str:
+    """ Turn the sort key of the last row (e.g. {"id": 42}) into an opaque string. """
+
+    # 1. Serialize compactly so the cursor stays short
+    raw = json.dumps(values, separators=(",", ":")).encode()
+
+    # 2. URL-safe base64 without '=' padding, so it can be passed as ?cursor=...
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """ Turn an opaque cursor back into its sort key. Raises ValueError if it was tampered with. """
+
+    try:
+        # 1. Restore the '=' padding we stripped in encode_cursor
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+    # 2. A cursor must always decode to a JSON object
+    if not isinstance(values, dict):
+        raise ValueError("Invalid cursor")
+
+    return values
+
+
+def decode_id_cursor(cursor: str | None) -> int | None:
+    """ Decode a cursor that pages over the integer primary key 'id'. """
+
+    if cursor is None:
+        return None
+
+    last_id = decode_cursor(cursor).get("id")
+    # bool is a subclass of int, so reject it explicitly
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise ValueError("Invalid cursor")
+    return last_id
+
+
+def encode_time_cursor(created_at: datetime, row_id: int) -> str:
+    """ Cursor for lists sorted by (timestamp, id), e.g. the audit log. """
+
+    return encode_cursor({"created_at": created_at.isoformat(), "id": row_id})
+
+
+def decode_time_cursor(cursor: str | None) -> tuple[datetime, int] | None:
+    """ Decode a cursor made by encode_time_cursor into (created_at, id). """
+
+    if cursor is None:
+        return None
+
+    values = decode_cursor(cursor)
+    row_id = values.get("id")
+    if not isinstance(row_id, int) or isinstance(row_id, bool) or not isinstance(values.get("created_at"), str):
+        raise ValueError("Invalid cursor")
+
+    # 'fromisoformat' raises ValueError itself for a malformed timestamp
+    try:
+        created_at = datetime.fromisoformat(values["created_at"])
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    return created_at, row_id
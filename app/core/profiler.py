@@ -0,0 +1,311 @@
+# This module is a small sampling profiler for individual requests.
+#
+# How it works: one background thread wakes up every few milliseconds and looks at
+# what each profiled request is doing right now, through the request task's chain of
+# 'await's (public asyncio and coroutine attributes only):
+#   - if the task is the one running on the event loop, the chain ends in the coroutine
+#     that is computing (plain functions it calls are counted towards it), and
+#   - otherwise it ends where the request is suspended (time spent waiting, e.g. for
+#     the database), followed by a '[waiting]' frame.
+# Counting how often each stack is seen gives a wall-clock profile, which is saved as
+# "collapsed stacks" (for flamegraph.pl / speedscope) or speedscope's own JSON format.
+#
+# Nothing is sampled unless a request is being profiled, so it costs nothing otherwise.
+# Two ways to profile:
+#   - on demand: an admin adds 'X-Profile: 1' (or '?profile=1') to a request; the
+#     response carries 'X-Profile-ID', and GET /admin/profiles/{id} returns the profile
+#     (for anyone else the flag is ignored and the request runs as usual)
+#   - automatically: with 'profiler_slowest_enabled', every request is sampled and the
+#     profile is kept only if the request was among the slowest 1% (rolling window)
+
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import Counter as StackCounter, OrderedDict, deque
+from datetime import datetime, timezone
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.metrics import Counter
+
+PROFILES_CAPTURED = Counter("app_profiles_captured_total", "Request profiles stored, by trigger.", ("reason",))
+
+WAITING_FRAME = "[waiting]"
+
+
+def _frame_label(frame) -> str:
+    """ 'function (package/module.py:line)', with the path shortened to its last two parts. """
+
+    code = frame.f_code
+    path = os.path.join(*code.co_filename.split(os.sep)[-2:]) if code.co_filename else "?"
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+def _await_stack(coro, waiting: bool = True) -> tuple:
+    """ The chain of awaits a coroutine is in, outermost first; ends with '[waiting]' if it is suspended. """
+
+    labels = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    if waiting:
+        labels.append(WAITING_FRAME)
+    return tuple(labels)
+
+
+class Profile:
+    """ The samples collected for one request. """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, method: str, path: str, interval: float, reason: str):
+        self.id = f"{int(time.time())}-{next(self._ids)}"
+        self.method = method
+        self.path = path
+        self.interval = interval
+        self.reason = reason
+        self.created_at = datetime.now(timezone.utc)
+        self.route = None
+        self.status = None
+        self.duration_ms = None
+        # stack (tuple of frame labels, outermost first) -> number of samples
+        self.stacks = StackCounter()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "reason": self.reason,
+            "samples": sum(self.stacks.values()),
+            "created_at": self.created_at,
+        }
+
+    def collapsed(self) -> str:
+        """ One line per stack: 'outer;inner;innermost count' (Brendan Gregg's format). """
+
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def speedscope(self) -> dict:
+        """ The profile in speedscope's file format (https://www.speedscope.app). """
+
+        frames, frame_index, samples, weights = [], {}, [], []
+        for stack, count in self.stacks.items():
+            indexes = []
+            for label in stack:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    frames.append({"name": label})
+                indexes.append(frame_index[label])
+            samples.append(indexes)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.method} {self.path}",
+            "exporter": "app.core.profiler",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{self.method} {self.path}",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+class Sampler:
+    """ The background thread that samples every request currently being profiled. """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        # task -> Profile, for the requests being profiled right now
+        self._active = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    def add(self, task: asyncio.Task, profile: Profile):
+        if self._thread is None:
+            # Started on first use, from the event loop thread itself
+            self._loop = asyncio.get_running_loop()
+            self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+            self._thread.start()
+        with self._lock:
+            self._active[task] = profile
+
+    def remove(self, task: asyncio.Task):
+        with self._lock:
+            self._active.pop(task, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            # Holding the lock while sampling means that once 'remove' returns,
+            # the profile is never written to again and can be read safely
+            with self._lock:
+                if not self._active:
+                    continue
+
+                # Which task is running on the event loop at this instant (None = idle)
+                running = asyncio.current_task(self._loop)
+                for task, profile in self._active.items():
+                    profile.stacks[_await_stack(task.get_coro(), waiting=task is not running)] += 1
+
+
+class ProfileStore:
+    """ Keeps the most recent 'maxsize' profiles; older ones are forgotten. """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._profiles = OrderedDict()
+
+    def add(self, profile: Profile):
+        self._profiles[profile.id] = profile
+        while len(self._profiles) > self.maxsize:
+            self._profiles.popitem(last=False)
+        PROFILES_CAPTURED.inc(reason=profile.reason)
+
+    def get(self, profile_id: str) -> Profile | None:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> list[Profile]:
+        # Newest first
+        return list(reversed(self._profiles.values()))
+
+
+class SlowRequestTracker:
+    """ Rolling latency percentile: is this request among the slowest (1 - percentile)? """
+
+    # Until this many requests were seen, nothing counts as "slow"
+    MIN_SAMPLES = 100
+    # The threshold is recomputed (a sort) only every this many requests
+    RECOMPUTE_EVERY = 100
+
+    def __init__(self, window: int, percentile: float):
+        self.percentile = percentile
+        self._durations = deque(maxlen=window)
+        self._threshold = None
+        self._since_recompute = 0
+
+    def is_slow(self, duration: float) -> bool:
+        self._durations.append(duration)
+        self._since_recompute += 1
+        if len(self._durations) >= self.MIN_SAMPLES and (
+            self._threshold is None or self._since_recompute >= self.RECOMPUTE_EVERY
+        ):
+            ordered = sorted(self._durations)
+            self._threshold = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+            self._since_recompute = 0
+        return self._threshold is not None and duration >= self._threshold
+
+
+sampler = Sampler(interval=settings.profiler_interval_ms / 1000)
+profile_store = ProfileStore(maxsize=settings.profiler_max_profiles)
+slow_requests = SlowRequestTracker(window=settings.profiler_window, percentile=settings.profiler_slowest_percentile)
+
+
+def _profile_requested(scope) -> bool:
+    """ True if the request asks to be profiled ('X-Profile: 1' header or '?profile=1'). """
+
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            return value in (b"1", b"true")
+    if b"profile=" in scope["query_string"]:
+        values = parse_qs(scope["query_string"].decode(errors="ignore")).get("profile", [])
+        return bool(values) and values[-1] in ("1", "true")
+    return False
+
+
+async def _authorize_admin(scope):
+    """ Raise HTTPException unless the request carries an admin's bearer token. """
+
+    # Imported here: these pull in the database layer, which the profiler does not otherwise need
+    from app.core.dependencies import get_current_user, require_role
+    from app.db.session import AsyncSessionLocal
+
+    authorization = dict(scope["headers"]).get(b"authorization", b"").decode(errors="ignore")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Profiling requires an admin token")
+
+    # The same checks as 'Depends(require_role("admin"))' on a route
+    async with AsyncSessionLocal() as db:
+        current_user = await get_current_user(token=token, db=db)
+    require_role("admin")(current_user=current_user)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests on demand (admins only) or, optionally, keeps the profiles of the
+    slowest requests. Must be the innermost middleware: the request's async work has to
+    run in the same task as this middleware for its samples to be attributed to it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.profiler_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        requested = _profile_requested(scope)
+        if requested:
+            try:
+                await _authorize_admin(scope)
+            except HTTPException:
+                # Not an admin: the request is served normally, just without a profile
+                requested = False
+        if not requested and not settings.profiler_slowest_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(
+            scope["method"],
+            scope["path"],
+            sampler.interval,
+            reason="requested" if requested else "slowest",
+        )
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if requested:
+                    # Tell the admin where to fetch the profile
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-profile-id", profile.id.encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        task = asyncio.current_task()
+        sampler.add(task, profile)
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.remove(task)
+            duration = time.perf_counter() - started_at
+
+            profile.route = getattr(scope.get("route"), "path", None)
+            profile.status = status_code
+            profile.duration_ms = round(duration * 1000, 2)
+
+            # On-demand profiles are always kept; automatic ones only for the slowest requests
+            slow = settings.profiler_slowest_enabled and slow_requests.is_slow(duration)
+            if requested or slow:
+                profile_store.add(profile)
@@ -0,0 +1,59 @@
+# This module implements a small in-memory "token bucket" rate limiter.
+#
+# Every key (a username, an IP address, ...) owns a bucket holding up to 'limit' tokens.
+# Each attempt takes one token, and tokens slowly refill at 'limit' per 'period_seconds'.
+# An empty bucket means "too many attempts" - the caller is told how long to wait.
+import math
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    """ Per-key token buckets with a bounded number of keys (least recently used are dropped). """
+
+    def __init__(self, limit: int, period_seconds: float, max_keys: int):
+        self.capacity = limit
+        self.refill_per_second = limit / period_seconds
+        self.max_keys = max_keys
+        # key -> (tokens left, time of last update). A tuple of two floats per key
+        # keeps memory small even with ~100k tracked keys.
+        self._buckets = OrderedDict()
+
+    def hit(self, key: str) -> float:
+        """ Take one token for 'key'. Returns 0 if allowed, otherwise seconds until retry. """
+
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+
+        # 1. Refill the tokens earned since the last attempt (never above capacity)
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+
+        # 2. Not even one token left: reject, and say when the next one arrives
+        if tokens < 1:
+            self._store(key, tokens, now)
+            return (1 - tokens) / self.refill_per_second
+
+        # 3. Allowed: spend one token
+        self._store(key, tokens - 1, now)
+        return 0
+
+    def refund(self, key: str):
+        """ Give back the token of an attempt that should not count (e.g. a successful login). """
+
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            tokens, updated_at = bucket
+            self._buckets[key] = (min(self.capacity, tokens + 1), updated_at)
+
+    def _store(self, key: str, tokens: float, now: float):
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        # Keep the table bounded: forget the keys that were quiet the longest
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+
+def retry_after_header(seconds: float) -> dict:
+    """ Build a Retry-After header (whole seconds, at least 1). """
+
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
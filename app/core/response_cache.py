@@ -0,0 +1,282 @@
+# This module caches whole HTTP responses: the final, already-encoded JSON bytes.
+#
+# The user cache (app/core/cache.py) saves the database query, but every GET still runs
+# the route, validates the data through its response_model and encodes the JSON again.
+# Here a repeated 'GET /users/?limit=50' is answered straight from memory instead:
+# no routing, no handler, no database, no serialization.
+#
+#   - Routes opt in with 'dependencies=[Depends(cached("users"))]'. The arguments are
+#     "tags" (placeholders like '{user_id}' are filled from the path); a write purges
+#     every response carrying one of its tags ('purge_tags').
+#   - Only successful GET responses without cookies are stored, keyed on path + query.
+#     A response built from a read replica is only stored while that replica keeps up
+#     with the primary ('response_cache_max_replica_lag_seconds').
+#   - Memory is bounded ('response_cache_max_bytes', least recently used entries go
+#     first), and every entry expires after 'response_cache_ttl_seconds'.
+#   - A hit whose ETag the client already has ('If-None-Match') is answered with 304.
+#   - 'Cache-Control: no-cache' on a request skips the lookup (the fresh answer is stored).
+#     Hits carry an 'X-Cache: HIT' header.
+
+import time
+from collections import OrderedDict
+
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.etags import none_match
+from app.core.metrics import Counter, Gauge
+
+# --- Metrics (rendered on GET /metrics) ---
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "app_response_cache_lookups_total",
+    "GET requests checked against the response cache, by result (hit, miss, bypass).",
+    ("result",),
+)
+RESPONSE_CACHE_HIT_RATIO = Gauge("app_response_cache_hit_ratio", "Share of response cache lookups that were hits.")
+RESPONSE_CACHE_BYTES_SAVED = Counter(
+    "app_response_cache_bytes_saved_total",
+    "Response body bytes served from the cache instead of being built again.",
+)
+RESPONSE_CACHE_BYTES = Gauge("app_response_cache_bytes", "Response body bytes held in the cache.")
+RESPONSE_CACHE_ENTRIES = Gauge("app_response_cache_entries", "Responses held in the cache.")
+RESPONSE_CACHE_EVICTIONS = Counter(
+    "app_response_cache_evictions_total",
+    "Responses dropped from the cache, by reason (size, expired, purged).",
+    ("reason",),
+)
+
+# Where a route's 'cached(...)' dependency leaves its tags for the middleware
+TAGS_SCOPE_KEY = "response_cache_tags"
+
+# Responses with these headers belong to one client and are never stored
+_UNCACHEABLE_HEADERS = (b"set-cookie", b"x-profile-id")
+
+
+def cached(*tags: str):
+    """ Dependency: store this route's responses under 'tags', e.g. Depends(cached("user:{user_id}")). """
+
+    def mark_cacheable(request: Request):
+        request.scope[TAGS_SCOPE_KEY] = [tag.format(**request.path_params) for tag in tags]
+
+    return mark_cacheable
+
+
+class _Entry:
+    __slots__ = ("expires_at", "status", "headers", "body", "etag", "tags", "route")
+
+    def __init__(self, expires_at, status, headers, body, etag, tags, route):
+        self.expires_at = expires_at
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.tags = tags
+        self.route = route
+
+
+class ResponseCache:
+    """ Encoded responses by URL, bounded by total body size, purgeable by tag. """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> _Entry; the first item is the least recently used one
+        self._entries = OrderedDict()
+        # tag -> keys of the entries carrying it
+        self._tags = {}
+        self._bytes = 0
+        self._hits = 0
+        self._lookups = 0
+        # Increased by every purge. A response that was being built while a purge
+        # happened may contain data from before the write, so it is not stored.
+        self.purges = 0
+
+    def get(self, key) -> _Entry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key, reason="expired")
+            self._update_gauges()
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def count_lookup(self, result: str):
+        """ Record a lookup as "hit", "miss" or "bypass" (for the hit ratio). """
+
+        RESPONSE_CACHE_LOOKUPS.inc(result=result)
+        self._lookups += 1
+        if result == "hit":
+            self._hits += 1
+        RESPONSE_CACHE_HIT_RATIO.set(self._hits / self._lookups)
+
+    def set(self, key, entry: _Entry):
+        if key in self._entries:
+            self._remove(key, reason=None)
+        self._entries[key] = entry
+        self._bytes += len(entry.body)
+        for tag in entry.tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        # Over the size limit: drop the least recently used entries
+        while self._bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)), reason="size")
+        self._update_gauges()
+
+    def purge_tags(self, *tags: str):
+        """ Drop every stored response carrying any of 'tags'. """
+
+        self.purges += 1
+        for tag in tags:
+            # A copy: '_remove' changes the set (and drops it once it is empty)
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key, reason="purged")
+        self._update_gauges()
+
+    def clear(self):
+        self.purges += 1
+        self._entries.clear()
+        self._tags.clear()
+        self._bytes = 0
+        self._update_gauges()
+
+    def _remove(self, key, reason: str | None):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        if reason is not None:
+            RESPONSE_CACHE_EVICTIONS.inc(reason=reason)
+
+    def _update_gauges(self):
+        RESPONSE_CACHE_BYTES.set(self._bytes)
+        RESPONSE_CACHE_ENTRIES.set(len(self._entries))
+
+
+response_cache = ResponseCache(
+    max_bytes=settings.response_cache_max_bytes,
+    ttl=settings.response_cache_ttl_seconds,
+)
+
+
+def _header(scope, name: bytes) -> bytes | None:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+def _must_bypass(scope) -> bool:
+    """ True if this request must get a freshly built response. """
+
+    if b"no-cache" in (_header(scope, b"cache-control") or b""):
+        return True
+    # A profiled request has to actually run (see app/core/profiler.py)
+    if _header(scope, b"x-profile") is not None or b"profile=" in scope["query_string"]:
+        return True
+    # With read replicas, a client that just wrote reads from the primary to see its own
+    # change; a cached response (perhaps built from a lagging replica) would hide it.
+    # Imported here: the database layer is only needed when the cookie is present.
+    if b"db_last_write" in (_header(scope, b"cookie") or b""):
+        from app.db.session import wrote_recently
+
+        return wrote_recently(Request(scope))
+    return False
+
+
+class ResponseCacheMiddleware:
+    """ Serves cached responses for GET requests and stores the responses of opted-in routes. """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not settings.response_cache_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        key = (scope["path"], scope["query_string"])
+        bypass = _must_bypass(scope)
+        if not bypass:
+            entry = response_cache.get(key)
+            if entry is not None:
+                response_cache.count_lookup("hit")
+                await self._send_cached(scope, entry, send)
+                return
+
+        # Miss: run the route, passing its response through while keeping a copy
+        purges_before = response_cache.purges
+        start = None
+        chunks = []
+        size = 0
+        storable = False
+
+        async def send_wrapper(message):
+            nonlocal start, size, storable
+            if message["type"] == "http.response.start":
+                start = message
+                # Only routes that opted in have set their tags by now (their 'cached'
+                # dependency ran before the handler); other responses are not copied
+                storable = (
+                    scope.get(TAGS_SCOPE_KEY) is not None
+                    and message["status"] == 200
+                    and not any(name in _UNCACHEABLE_HEADERS for name, _ in message.get("headers", []))
+                )
+            elif message["type"] == "http.response.body" and storable:
+                size += len(message.get("body", b""))
+                if size > settings.response_cache_max_entry_bytes:
+                    storable = False
+                    chunks.clear()
+                else:
+                    chunks.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+        # Only routes that opted in (they set the tags while handling the request)
+        # count towards the hit ratio and are stored
+        tags = scope.get(TAGS_SCOPE_KEY)
+        if tags is None:
+            return
+        response_cache.count_lookup("bypass" if bypass else "miss")
+        if start is None or not storable or response_cache.purges != purges_before:
+            return
+        # Imported here, like in '_must_bypass'
+        from app.db.session import reads_are_fresh
+
+        # A lagging replica may have answered with data from before a recent write
+        if not await reads_are_fresh(scope) or response_cache.purges != purges_before:
+            return
+        headers = [(name, value) for name, value in start.get("headers", []) if name != b"date"]
+        etag = dict(headers).get(b"etag")
+        response_cache.set(key, _Entry(
+            expires_at=time.monotonic() + response_cache.ttl,
+            status=start["status"],
+            headers=headers,
+            body=b"".join(chunks),
+            etag=etag.decode() if etag else None,
+            tags=tags,
+            route=scope.get("route"),
+        ))
+
+    @staticmethod
+    async def _send_cached(scope, entry: _Entry, send):
+        # Outer middleware (metrics) labels the request by the route that built the entry
+        scope["route"] = entry.route
+        RESPONSE_CACHE_BYTES_SAVED.inc(len(entry.body))
+
+        if_none_match = _header(scope, b"if-none-match")
+        if entry.etag is not None and if_none_match and none_match(if_none_match.decode("latin-1"), entry.etag):
+            # The client already has it: no body at all
+            await send({"type": "http.response.start", "status": 304, "headers": [(b"etag", entry.etag.encode())]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        headers = [*entry.headers, (b"x-cache", b"HIT")]
+        await send({"type": "http.response.start", "status": entry.status, "headers": headers})
+        await send({"type": "http.response.body", "body": entry.body})
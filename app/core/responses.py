@@ -0,0 +1,53 @@
+# This module holds the response class of the "fast read path".
+#
+# Normally a route returns Python objects and FastAPI validates them against the
+# route's response_model (one Pydantic model per row) before encoding the JSON.
+# Routes that already have plain, JSON-ready dicts (e.g. rows selected as columns)
+# can skip that step by returning a FastJSONResponse directly.
+#
+# 'orjson' (a JSON encoder written in Rust) is used when it is installed
+# ('pip install orjson'); otherwise the standard library encoder is used.
+
+import json
+
+from starlette.responses import JSONResponse, Response
+
+from app.core.etags import content_etag, none_match
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(content) -> bytes:
+    """ Encode plain Python data (dicts, lists, str, int, ...) as compact JSON bytes. """
+
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """ A JSON response for content that needs no validation, encoded with orjson if available. """
+
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
+
+def conditional_json_response(content, if_none_match: str | None) -> Response:
+    """
+    Encode JSON-ready 'content' with an ETag computed from the body itself:
+    304 if the client already has exactly this body.
+    """
+
+    return conditional_response(dumps_json(content), if_none_match)
+
+
+def conditional_response(body: bytes, if_none_match: str | None) -> Response:
+    """ Send an already encoded JSON body with an ETag of its own: 304 if the client has it. """
+
+    etag = content_etag(body)
+    if none_match(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
@@ -3,6 +3,14 @@
 # This module handles password hashing and verification using the Passlib library.
 from passlib.context import CryptContext
 
+# 'asyncio' and 'ThreadPoolExecutor' let us run slow hashing in background threads.
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram
+
 # This module handles JWT creation and verification.
 # We use 'jose' for working with JSON Web Tokens.
 from datetime import datetime, timedelta
@@ -50,4 +58,114 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """ Check if the provided plain password matches the hashed password. """
 
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+# --- Hashing off the event loop ---
+# A bcrypt call takes ~100-300 ms of pure CPU. Called directly inside an 'async def'
+# route, it freezes the whole server for that long. Instead we hand it to a small,
+# dedicated thread pool (bcrypt releases the GIL, so the threads really run in parallel)
+# and 'await' the result while the event loop keeps serving other requests.
+
+class HashingBusyError(Exception):
+    """ Raised when too many hashes are already running or waiting. """
+
+
+hash_executor = ThreadPoolExecutor(
+    max_workers=settings.hash_workers,
+    thread_name_prefix="password-hash",
+)
+
+# Number of hashes currently running or waiting in the pool.
+# Only touched from the event loop thread, so a plain integer is safe.
+_hashes_in_flight = 0
+
+HASH_QUEUE_DEPTH = Gauge("app_password_hash_queue_depth", "Password hashes waiting for a free worker.")
+HASH_IN_FLIGHT = Gauge("app_password_hash_in_flight", "Password hashes running or waiting.")
+HASH_REJECTED = Counter("app_password_hash_rejected_total", "Hash requests refused because the pool was full.")
+HASH_SECONDS = Histogram(
+    "app_password_hash_seconds",
+    "Time spent computing a password hash (excluding queue wait).",
+    ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.5),
+)
+HASH_WAIT_SECONDS = Histogram(
+    "app_password_hash_wait_seconds",
+    "Time a password hash waited in the queue before a worker picked it up.",
+)
+
+
+async def _run_in_hash_pool(operation: str, func, *args):
+    global _hashes_in_flight
+
+    # 1. Fail fast: if every worker is busy AND the queue is full, waiting would only
+    #    make the client time out later. Better to say "try again" immediately.
+    if _hashes_in_flight >= settings.hash_workers + settings.hash_queue_size:
+        HASH_REJECTED.inc()
+        raise HashingBusyError("Password hashing capacity exhausted")
+
+    submitted_at = time.perf_counter()
+
+    def timed_call():
+        # Runs inside the worker thread
+        started_at = time.perf_counter()
+        HASH_WAIT_SECONDS.observe(started_at - submitted_at)
+        try:
+            return func(*args)
+        finally:
+            HASH_SECONDS.observe(time.perf_counter() - started_at, operation=operation)
+
+    # 2. Queue the work and wait for it without blocking the event loop
+    loop = asyncio.get_running_loop()
+    _hashes_in_flight += 1
+    _update_hash_gauges()
+    future = hash_executor.submit(timed_call)
+    # The slot is freed when the HASH is finished, not when we stop waiting for it:
+    # a cancelled request (deadline, disconnect) leaves bcrypt running in its thread.
+    future.add_done_callback(lambda _: _call_in_loop(loop, _hash_finished))
+    return await asyncio.wrap_future(future)
+
+
+def _call_in_loop(loop, callback):
+    # Done-callbacks run in the worker thread; the counter belongs to the event loop
+    try:
+        loop.call_soon_threadsafe(callback)
+    except RuntimeError:
+        # The loop has already been closed (shutdown): nobody needs the count any more
+        pass
+
+
+def _hash_finished():
+    global _hashes_in_flight
+    _hashes_in_flight -= 1
+    _update_hash_gauges()
+
+
+def _update_hash_gauges():
+    HASH_IN_FLIGHT.set(_hashes_in_flight)
+    HASH_QUEUE_DEPTH.set(max(0, _hashes_in_flight - settings.hash_workers))
+
+
+async def hash_password_async(password: str) -> str:
+    """ Same as hash_password, but runs in the hashing pool. May raise HashingBusyError. """
+
+    return await _run_in_hash_pool("hash", hash_password, password)
+
+
+async def hash_passwords_async(passwords: list[str]) -> list[str]:
+    """
+    Hash many passwords in the hashing pool, 'hash_workers' at a time (so a big batch
+    neither floods the queue nor fails with HashingBusyError on its own).
+    """
+
+    hashed = []
+    for start in range(0, len(passwords), settings.hash_workers):
+        window = passwords[start:start + settings.hash_workers]
+        hashed.extend(await asyncio.gather(*(hash_password_async(password) for password in window)))
+    return hashed
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """ Same as verify_password, but runs in the hashing pool. May raise HashingBusyError. """
+
+    return await _run_in_hash_pool("verify", verify_password, plain_password, hashed_password)
\ No newline at end of file
@@ -0,0 +1,124 @@
+# This module makes identical concurrent reads share ONE database call ("single-flight").
+#
+# During a traffic spike hundreds of clients may ask for the same user at the same
+# moment. Without coalescing, every one of them misses the cache and runs its own
+# query. With it, the first request (the "leader") runs the query; requests that
+# arrive while it is still running (the "followers") wait for it and get the same result.
+#
+# Calls are keyed on the route and its parameters, e.g. ("users.get_user", 42, "primary", None).
+# Results are shared between requests, so callers must treat them as read-only.
+#
+# Errors are shared too, with one exception: if the leader stopped for reasons of its
+# OWN (its client disconnected, its deadline passed, no pool connection within its
+# timeout), its followers do not fail with it; they simply try again.
+
+import asyncio
+
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+
+from app.core.config import settings
+from app.core.deadlines import DeadlineExceeded
+from app.core.metrics import Counter, Gauge
+
+# --- Metrics (rendered on GET /metrics) ---
+FLIGHT_CALLS = Counter(
+    "app_singleflight_calls_total",
+    "Reads that ran their own database call (leaders), by route.",
+    ("route",),
+)
+FLIGHT_COLLAPSED = Counter(
+    "app_singleflight_collapsed_total",
+    "Reads that shared a call already in flight instead of running their own, by route.",
+    ("route",),
+)
+FLIGHT_RETRIES = Counter(
+    "app_singleflight_retries_total",
+    "Followers that had to start over because their leader gave up early, by route.",
+    ("route",),
+)
+FLIGHTS_IN_PROGRESS = Gauge("app_singleflight_in_progress", "Shared calls currently running.")
+
+
+def _leader_only(exc: BaseException) -> bool:
+    """ True for errors caused by the leader's own limits rather than by the read itself. """
+
+    if isinstance(exc, (asyncio.CancelledError, DeadlineExceeded, TimeoutError, PoolTimeoutError)):
+        return True
+    # PostgreSQL cancelled the query because of the leader's 'statement_timeout'
+    return isinstance(exc, DBAPIError) and getattr(exc.orig, "sqlstate", None) == "57014"
+
+
+class _Call:
+    """ One call in flight: followers wait for 'done', then read 'result' or 'error'. """
+
+    __slots__ = ("done", "result", "error", "leader_gone")
+
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.result = None
+        self.error = None
+        self.leader_gone = False
+
+
+class SingleFlight:
+    """ Runs at most one call per key at a time; concurrent callers share its outcome. """
+
+    def __init__(self):
+        # key -> _Call, only while the call is running
+        self._calls = {}
+
+    async def do(self, key: tuple, fn, *args, **kwargs):
+        """ Return 'await fn(*args, **kwargs)', sharing a call with the same key already in flight. """
+
+        # key[0] names the route, e.g. "users.get_user"
+        route = key[0]
+        if not settings.singleflight_enabled:
+            return await fn(*args, **kwargs)
+
+        # 1. Someone is already asking the same thing: wait for their answer
+        call = self._calls.get(key)
+        if call is not None:
+            FLIGHT_COLLAPSED.inc(route=route)
+        while call is not None:
+            await call.done.wait()
+            if not call.leader_gone:
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            # The leader gave up for its own reasons; one of us becomes the new leader
+            FLIGHT_RETRIES.inc(route=route)
+            call = self._calls.get(key)
+
+        # 2. We are the leader: run the call and publish its outcome
+        call = self._calls[key] = _Call()
+        FLIGHT_CALLS.inc(route=route)
+        FLIGHTS_IN_PROGRESS.inc()
+        try:
+            call.result = await fn(*args, **kwargs)
+            return call.result
+        except BaseException as exc:
+            if _leader_only(exc):
+                call.leader_gone = True
+            else:
+                call.error = exc
+            raise
+        finally:
+            FLIGHTS_IN_PROGRESS.dec()
+            # 'forget' may already have replaced or removed our entry
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            call.done.set()
+
+    def forget(self, prefix: tuple):
+        """
+        Let the next caller start a fresh call for every key starting with 'prefix',
+        even if one is still in flight. Used after a write, so nobody joins a read that
+        started before it.
+        """
+
+        for key in [key for key in self._calls if key[:len(prefix)] == prefix]:
+            del self._calls[key]
+
+
+# Shared by the read routes of both user services (keys start with the route name).
+reads = SingleFlight()
@@ -1,24 +1,60 @@
-from psycopg2 import pool
+import asyncio
+
+# 'asyncpg' is a fast, fully asynchronous PostgreSQL driver. Unlike psycopg2,
+# waiting for the database never blocks a thread: the event loop serves other
+# requests in the meantime.
+import asyncpg
 from app.core.config import Settings
+# Counts queries and database time per request
+from app.db.query_stats import instrument_asyncpg_connection
 
 # 1. Initialize the Settings object we defined.
 # This reads the .env file and validates the database credentials.
 settings = Settings()
 
-# 2. Create a 'SimpleConnectionPool' instance.
-# This manages a set of connections to PostgreSQL database.
-db_pool = pool.SimpleConnectionPool(
-    # 3. The minimum number of connections to keep open at all times.
-    minconn=1,
-    
-    # 4. The maximum number of connections the pool can open.
-    # This protects database from being overwhelmed by too many requests.
-    maxconn=5,
-    
-    # 5. Connection details pulled directly from our validated Settings object.
-    host=settings.db_host,
-    port=settings.db_port,
-    database=settings.db_name,
-    user=settings.db_user,
-    password=settings.db_password,
-)
+# 2. The connection pool is created lazily, on first use, because asyncpg pools
+# must be created inside a running event loop (not at import time).
+_pool: asyncpg.Pool | None = None
+_pool_lock = asyncio.Lock()
+
+
+async def get_pool() -> asyncpg.Pool:
+    """ Return the shared asyncpg pool, creating it on first use. """
+
+    global _pool
+    if _pool is None:
+        # The lock makes sure concurrent first requests create only ONE pool
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(
+                    # 3. Connection details pulled directly from our validated Settings object.
+                    host=settings.db_host,
+                    port=settings.db_port,
+                    database=settings.db_name,
+                    user=settings.db_user,
+                    password=settings.db_password,
+
+                    # 4. Sized like the ORM engine's pool: 'db_pool_size' connections kept open,
+                    # up to 'db_max_overflow' more under load. Requests wait for a free
+                    # connection instead of failing with "pool exhausted".
+                    min_size=settings.db_pool_size,
+                    max_size=settings.db_pool_size + settings.db_max_overflow,
+
+                    # 5. Every distinct SQL text is prepared once per connection and then
+                    # reused, so PostgreSQL skips parsing and planning on repeat calls.
+                    statement_cache_size=settings.db_statement_cache_size,
+                    timeout=settings.db_connect_timeout,
+
+                    # 6. Runs once for every new connection: report its queries to the request stats.
+                    init=instrument_asyncpg_connection,
+                )
+    return _pool
+
+
+async def close_pool():
+    """ Close every pooled connection (called when the application shuts down). """
+
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
@@ -0,0 +1,150 @@
+# This module keeps the monthly partitions of 'audit_events' in shape:
+#   - partitions for the next few months are created BEFORE they are needed
+#     (an insert with no matching partition would fail), and
+#   - partitions older than the retention period are dropped (instant, unlike DELETE).
+# Events for a month without a partition land in 'audit_events_default' (see the
+# migration b4c8e2a7d519) and are moved into their month once it gets a partition.
+# It runs once at startup and then periodically in the background (see app/main.py).
+
+import asyncio
+import logging
+import re
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge
+from app.db.session import engine
+
+# Partitions are named after their month, e.g. 'audit_events_y2026m10'
+PARENT_TABLE = "audit_events"
+DEFAULT_PARTITION = "audit_events_default"
+PARTITION_NAME = re.compile(r"^audit_events_y(\d{4})m(\d{2})$")
+
+logger = logging.getLogger("app.audit")
+
+# --- Metrics (rendered on GET /metrics) ---
+PARTITIONS_CREATED = Counter("app_audit_partitions_created_total", "Monthly audit partitions created.")
+PARTITIONS_DROPPED = Counter("app_audit_partitions_dropped_total", "Expired audit partitions dropped.")
+PARTITIONS_PRESENT = Gauge("app_audit_partitions", "Monthly audit partitions currently attached.")
+
+
+def month_start(moment: datetime) -> datetime:
+    """ The first instant (UTC) of the month containing 'moment'. """
+
+    return moment.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    """ Move a month start forwards (or backwards, for a negative count) by 'count' months. """
+
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT_TABLE}_y{month:%Y}m{month:%m}"
+
+
+async def list_partitions(conn) -> dict[datetime, str]:
+    """ Return {month start: partition name} for every monthly partition of audit_events. """
+
+    # The parent is resolved like any table name (through the search_path), so a table
+    # of the same name in another schema is not mixed in
+    result = await conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = CAST(:parent AS regclass)"
+    ), {"parent": PARENT_TABLE})
+
+    partitions = {}
+    for name in result.scalars():
+        match = PARTITION_NAME.match(name)
+        # Partitions we did not name ourselves are left alone
+        if match:
+            month = datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)
+            partitions[month] = name
+    return partitions
+
+
+async def _create_partition(conn, month: datetime) -> str:
+    """
+    Create the partition for 'month' and return its name. 'CREATE TABLE ... PARTITION OF'
+    fails if the default partition holds rows of that month, so the table is created on
+    its own, those rows are moved into it, and only then is it attached.
+    """
+
+    name = partition_name(month)
+    # DDL cannot take bind parameters; the values are generated here, not user input
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    await conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} "
+        f"(LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    ))
+    await conn.execute(text(
+        f"WITH moved AS ("
+        f"  DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= '{lower}' AND created_at < '{upper}'"
+        f"  RETURNING id, created_at, action, actor, details"
+        f") INSERT INTO {name} (id, created_at, action, actor, details) SELECT * FROM moved"
+    ))
+    # The parent's indexes are created on the new partition as it is attached
+    await conn.execute(text(
+        f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    ))
+    return name
+
+
+async def maintain_audit_partitions(now: datetime | None = None) -> dict:
+    """ Create missing partitions up to 'audit_partition_months_ahead' and drop expired ones. """
+
+    current = month_start(now or datetime.now(timezone.utc))
+    created, dropped = [], []
+
+    async with engine.begin() as conn:
+        existing = await list_partitions(conn)
+
+        # 1. This month and the next few months must exist before events arrive for them
+        for offset in range(settings.audit_partition_months_ahead + 1):
+            month = add_months(current, offset)
+            if month in existing:
+                continue
+            name = await _create_partition(conn, month)
+            existing[month] = name
+            created.append(name)
+
+        # 2. Whole months older than the retention period are dropped (0 keeps everything)
+        if settings.audit_retention_months > 0:
+            oldest_kept = add_months(current, -settings.audit_retention_months)
+            for month, name in sorted(existing.items()):
+                if month < oldest_kept:
+                    await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                    del existing[month]
+                    dropped.append(name)
+            # Expired events that ended up in the default partition go as well
+            await conn.execute(
+                text(f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at < :oldest_kept"),
+                {"oldest_kept": oldest_kept},
+            )
+
+    PARTITIONS_CREATED.inc(len(created))
+    PARTITIONS_DROPPED.inc(len(dropped))
+    PARTITIONS_PRESENT.set(len(existing))
+    return {"created": created, "dropped": dropped}
+
+
+async def run_partition_maintenance(interval_seconds: float):
+    """ Run 'maintain_audit_partitions' now and then every 'interval_seconds', until cancelled. """
+
+    while True:
+        try:
+            result = await maintain_audit_partitions()
+            if result["created"] or result["dropped"]:
+                logger.info(
+                    "Audit partitions maintained",
+                    extra={"partitions_created": result["created"], "partitions_dropped": result["dropped"]},
+                )
+        except Exception:
+            # Try again next time; the months ahead give plenty of slack
+            logger.exception("Audit partition maintenance failed")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,71 @@
+# This module adds monitoring to SQLAlchemy's connection pool.
+# Every request borrows ("checks out") a connection from the pool. When all of them
+# are busy, requests have to WAIT - and that waiting is invisible latency unless we measure it.
+import time
+
+# 'AsyncAdaptedQueuePool' is the pool SQLAlchemy uses by default for async engines.
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.core.metrics import Counter, Gauge, Histogram
+
+# --- Metrics (rendered on GET /metrics), labelled by pool name ---
+POOL_CHECKED_OUT = Gauge("app_db_pool_checked_out", "Connections currently lent out to requests.", ("pool",))
+POOL_OVERFLOW = Gauge("app_db_pool_overflow", "Connections open beyond pool_size (negative = idle capacity).", ("pool",))
+POOL_OVERFLOW_OPENED = Counter(
+    "app_db_pool_overflow_opened_total",
+    "Extra connections opened because pool_size was exhausted.",
+    ("pool",),
+)
+POOL_TIMEOUTS = Counter(
+    "app_db_pool_timeouts_total",
+    "Checkouts that gave up after pool_timeout seconds.",
+    ("pool",),
+)
+POOL_WAIT_SECONDS = Histogram(
+    "app_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool.",
+    ("pool",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    A normal async queue pool that also records checkout wait times and usage.
+    The metric label is the engine's 'pool_logging_name' (e.g. "primary").
+    """
+
+    @property
+    def metrics_name(self) -> str:
+        return self._orig_logging_name or "primary"
+
+    def _do_get(self):
+        # Runs whenever a session needs a connection: time how long that takes
+        started_at = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.inc(pool=self.metrics_name)
+            raise
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - started_at, pool=self.metrics_name)
+
+        self._update_gauges()
+        return connection
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._update_gauges()
+
+    def _inc_overflow(self) -> bool:
+        # Called before a new connection is opened; a positive overflow afterwards
+        # means this connection goes beyond 'pool_size'
+        opened = super()._inc_overflow()
+        if opened and self._overflow > 0:
+            POOL_OVERFLOW_OPENED.inc(pool=self.metrics_name)
+        return opened
+
+    def _update_gauges(self):
+        POOL_CHECKED_OUT.set(self.checkedout(), pool=self.metrics_name)
+        POOL_OVERFLOW.set(self.overflow(), pool=self.metrics_name)
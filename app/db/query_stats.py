@@ -0,0 +1,130 @@
+# This module counts the SQL queries each request runs and how long they take.
+#
+# Both database paths report here:
+#   - the SQLAlchemy engines (ORM service), through "before/after_cursor_execute" events
+#   - the asyncpg pool (raw SQL service), through asyncpg's query logger
+# The totals are added to the request log and sent back in a 'Server-Timing' header,
+# so browser dev tools show the database time of every response.
+#
+# It also spots the classic "N+1" pattern: one query for a list, then one more
+# query PER ROW (e.g. lazily loading 'User.addresses' in a loop). Such requests run
+# the same statement shape many times; above a threshold they are flagged.
+
+import re
+from collections import Counter as ShapeCounter
+from contextvars import ContextVar
+from time import perf_counter
+
+from sqlalchemy import event
+
+from app.core.metrics import Counter, Histogram
+
+# --- Metrics (rendered on GET /metrics) ---
+DB_QUERIES_PER_REQUEST = Histogram(
+    "app_db_queries_per_request",
+    "SQL queries executed per HTTP request.",
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+N_PLUS_ONE_REQUESTS = Counter(
+    "app_db_n_plus_one_requests_total",
+    "Requests that ran the same statement shape more often than the threshold.",
+    ("route",),
+)
+
+# Placeholders and literals vary between executions of the "same" query; replace them.
+# Type casts ('$1::INTEGER') are dropped first, so they are not mistaken for placeholders.
+_CAST = re.compile(r"::\w+(?:\[\])?")
+_IN_LIST = re.compile(r"\(\s*(?:\$\d+|%\(\w+\)s|\?|:\w+)(?:\s*,\s*(?:\$\d+|%\(\w+\)s|\?|:\w+))*\s*\)")
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|:\w+")
+_NUMBER = re.compile(r"\b\d+\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """ Reduce a SQL statement to its shape, e.g. 'SELECT ... WHERE id = ?'. """
+
+    shape = _CAST.sub("", statement)
+    shape = _IN_LIST.sub("(?)", shape)
+    shape = _PLACEHOLDER.sub("?", shape)
+    shape = _NUMBER.sub("?", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class QueryStats:
+    """ The queries run while handling one request. """
+
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # Raw statement text -> number of executions. Shapes are only computed at the
+        # end of the request ('repeated_shapes'), so each query costs a dict update.
+        self.statements = ShapeCounter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated_shapes(self, threshold: int) -> dict[str, int]:
+        """ Statement shapes executed more than 'threshold' times (0 disables the check). """
+
+        if threshold <= 0 or self.count <= threshold:
+            return {}
+        by_shape = ShapeCounter()
+        for statement, count in self.statements.items():
+            by_shape[statement_shape(statement)] += count
+        return {shape: count for shape, count in by_shape.items() if count > threshold}
+
+
+# The stats of the request being handled (None outside a request, e.g. background tasks).
+# The request middleware puts a fresh QueryStats here; queries add to it.
+query_stats_var: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def record_query(statement: str, seconds: float):
+    stats = query_stats_var.get()
+    if stats is not None:
+        stats.record(statement, seconds)
+
+
+# --- SQLAlchemy engines ---
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # A stack, because a query can start inside another one's events (rare, but possible)
+    conn.info.setdefault("query_started_at", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info["query_started_at"].pop()
+    record_query(statement, perf_counter() - started_at)
+
+
+def _handle_error(exception_context):
+    # A failed query never reaches 'after_cursor_execute'; still count its time
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started_at"):
+        started_at = connection.info["query_started_at"].pop()
+        record_query(exception_context.statement or "", perf_counter() - started_at)
+
+
+def instrument_engine(engine):
+    """ Count the queries of an (async) SQLAlchemy engine. """
+
+    # Events are attached to the synchronous core inside the async engine
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", _handle_error)
+
+
+# --- asyncpg pool ---
+def _asyncpg_query_logger(record):
+    # asyncpg schedules this with 'call_soon', which keeps the context of the
+    # request that ran the query, so 'query_stats_var' still finds its stats
+    record_query(record.query, record.elapsed)
+
+
+async def instrument_asyncpg_connection(conn):
+    """ Count the queries of an asyncpg connection (used as the pool's 'init' hook). """
+
+    conn.add_query_logger(_asyncpg_query_logger)
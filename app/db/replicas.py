@@ -0,0 +1,78 @@
+# This module decides WHICH database a read-only request should use.
+# Read replicas are copies of the primary database that can answer SELECTs,
+# so spreading reads over them takes load off the primary (which handles all writes).
+import itertools
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+
+from app.core.metrics import Counter
+
+READS_ROUTED = Counter("app_db_reads_routed_total", "Read-only sessions opened, by target database.", ("target",))
+REPLICA_FAILURES = Counter("app_db_replica_failures_total", "Times a replica could not be reached.", ("replica",))
+
+# Seconds the replica is behind the primary: 0 when it has replayed everything it received
+# (an idle primary sends nothing, so the last replay time alone would look like lag),
+# and 0 as well on a server that is not a replica at all.
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class ReplicaSet:
+    """ A group of replica engines with a selection strategy and simple health tracking. """
+
+    def __init__(self, engines: list, strategy: str, retry_seconds: float, lag_check_seconds: float = 1):
+        self.engines = engines
+        self.strategy = strategy
+        self.retry_seconds = retry_seconds
+        self.lag_check_seconds = lag_check_seconds
+        # engine -> time (monotonic) until which it is considered down
+        self._down_until = {}
+        # engine -> (time measured (monotonic), lag in seconds or None)
+        self._lag = {}
+        self._round_robin = itertools.count()
+
+    def _healthy(self) -> list:
+        now = time.monotonic()
+        return [e for e in self.engines if self._down_until.get(e, 0) <= now]
+
+    def choose(self):
+        """ Pick a replica engine, or None if there is no healthy replica. """
+
+        healthy = self._healthy()
+        if not healthy:
+            return None
+
+        if self.strategy == "least_connections":
+            # The replica with the fewest connections currently lent out to requests
+            return min(healthy, key=lambda e: e.pool.checkedout())
+
+        # Default: round-robin, each read goes to the next replica in turn
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def mark_down(self, engine):
+        """ Skip a replica for 'retry_seconds' after it failed; it is tried again afterwards. """
+
+        self._down_until[engine] = time.monotonic() + self.retry_seconds
+        REPLICA_FAILURES.inc(replica=engine.pool.metrics_name)
+
+    async def lag_seconds(self, engine) -> float | None:
+        """ How many seconds 'engine' is behind the primary, or None if it could not be asked. """
+
+        now = time.monotonic()
+        measured = self._lag.get(engine)
+        if measured is not None and now - measured[0] < self.lag_check_seconds:
+            return measured[1]
+
+        try:
+            async with engine.connect() as conn:
+                lag = float((await conn.execute(REPLICA_LAG_SQL)).scalar_one())
+        except (OSError, DBAPIError, PoolTimeoutError):
+            lag = None
+        self._lag[engine] = (now, lag)
+        return lag
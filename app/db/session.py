@@ -3,12 +3,30 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
 # 'sessionmaker' is a utility used to create a consistent configuration for individual database sessions (tasks).
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+# 'event' lets us run code whenever a session starts a transaction
+from sqlalchemy import event
 
 # 'Settings' is our custom configuration class that pulls validated 
 # credentials (user, password, host) from the .env file.
 from app.core.config import Settings
 
+# A connection pool that also records wait times and usage for monitoring
+from app.db.pool import InstrumentedPool
+# Chooses a read replica for read-only sessions
+from app.db.replicas import ReplicaSet, READS_ROUTED
+# Counts queries and database time per request
+from app.db.query_stats import instrument_engine
+# Time left before the current request's deadline
+from app.core.deadlines import statement_timeout_ms
+
+# Errors that mean "this database could not be reached"
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+
+# 'Request'/'Response' let get_db look at the HTTP method and set a cookie.
+from fastapi import Request, Response
+import time
+
 # 1. Load the configuration from your .env file
 settings = Settings()
 
@@ -24,27 +42,181 @@ DATABASE_URL = (
 # 3. Create the Async Engine
 # This is the actual "connection manager" to the database.
 # 'echo=False' means it won't print every SQL query to your console (set to True for debugging).
-engine = create_async_engine(DATABASE_URL, echo=False)
+# The pool settings come from Settings so they can be tuned per environment, and
+# 'InstrumentedPool' reports checkout waits and pool usage on GET /metrics,
+# and 'instrument_engine' adds every query to the current request's stats.
+def create_engine_for(url: str, name: str):
+    new_engine = create_async_engine(
+        url,
+        echo=False,
+        poolclass=InstrumentedPool,
+        pool_logging_name=name,   # Also used as the 'pool' label of the metrics
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args={
+            # asyncpg's own cache of prepared statements, per connection
+            "statement_cache_size": settings.db_statement_cache_size,
+            # SQLAlchemy's cache of prepared statements on top of asyncpg
+            "prepared_statement_cache_size": settings.db_statement_cache_size,
+            # Give up quickly on a database that does not answer (e.g. a dead replica)
+            "timeout": settings.db_connect_timeout,
+        },
+    )
+    instrument_engine(new_engine)
+    return new_engine
+
+
+# The primary database: all writes (and reads that need the very latest data) go here.
+engine = create_engine_for(DATABASE_URL, "primary")
+
+# Optional read replicas: read-only routes spread their queries over these.
+replica_set = ReplicaSet(
+    [create_engine_for(url, f"replica{i}") for i, url in enumerate(settings.db_replica_urls)],
+    strategy=settings.db_replica_strategy,
+    retry_seconds=settings.db_replica_retry_seconds,
+    lag_check_seconds=settings.db_replica_lag_check_seconds,
+)
+
+# The synchronous session class behind our AsyncSessions. It is its own subclass so
+# that the event below only applies to the app's sessions.
+class DeadlineSession(Session):
+    pass
+
+
+# Every transaction of a request starts by telling PostgreSQL how long the request may
+# still take. A query that runs past the deadline is then cancelled by the server itself,
+# which frees the connection for other requests (instead of holding it until the query ends).
+@event.listens_for(DeadlineSession, "after_begin")
+def apply_statement_timeout(session, transaction, connection):
+    timeout_ms = statement_timeout_ms()
+    if timeout_ms is not None:
+        # 'SET LOCAL' only lasts until the end of this transaction
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+
+
+# Remember whether a session changed any data (INSERT/UPDATE/DELETE statements, or a
+# flush of ORM objects), so get_db only sets the read-your-writes cookie after real writes.
+WROTE = "wrote"
+
+
+@event.listens_for(DeadlineSession, "do_orm_execute")
+def note_write_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[WROTE] = True
+
+
+@event.listens_for(DeadlineSession, "after_flush")
+def note_flush(session, flush_context):
+    session.info[WROTE] = True
+
+
+@event.listens_for(DeadlineSession, "after_rollback")
+def forget_writes(session):
+    # Rolled back: nothing was written after all
+    session.info.pop(WROTE, None)
+
 
 # 4. Create a Session Factory (AsyncSessionLocal)
 # This is a 'factory' that produces a new database session whenever we need one.
 AsyncSessionLocal = sessionmaker(
     engine,
     class_=AsyncSession,      # Ensures all sessions created are asynchronous
+    sync_session_class=DeadlineSession,  # Applies the request deadline (see above)
     expire_on_commit=False,   # Prevents SQLAlchemy from "refreshing" objects 
                               # automatically after a commit, which is safer for async.
 )
 
 
 
+# Name of the cookie that remembers when this client last wrote something.
+LAST_WRITE_COOKIE = "db_last_write"
+
+# HTTP methods that never change data
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
 # 'async def' allows this to run without blocking the server.
-async def get_db():
+async def get_db(request: Request, response: Response):
     # 1. Opens a new database session from the factory.
     # The 'async with' ensures the session is cleaned up automatically.
     async with AsyncSessionLocal() as session:
-        
+
+        # With replicas in use, a client whose request COMMITTED a write reads from the
+        # primary until the replicas have caught up ("read your writes"). Requests that
+        # only read (like POST /auth/login) keep using the replicas.
+        if replica_set.engines and request.method not in READ_ONLY_METHODS:
+            @event.listens_for(session.sync_session, "after_commit")
+            def remember_write(sync_session):
+                if sync_session.info.pop(WROTE, False):
+                    response.set_cookie(
+                        LAST_WRITE_COOKIE,
+                        str(time.time()),
+                        max_age=int(settings.db_read_your_writes_seconds) + 1,
+                        httponly=True,
+                    )
+
         # 2. 'yield' sends the session to the API route.
         # It pauses here while the route uses the database.
         yield session
 
-    # 3. Once the route is done, the code resumes and closes the session.
\ No newline at end of file
+    # 3. Once the route is done, the code resumes and closes the session.
+
+
+def wrote_recently(request: Request) -> bool:
+    """ True if this client wrote data within the read-your-writes window. """
+
+    try:
+        last_write = float(request.cookies.get(LAST_WRITE_COOKIE, "0"))
+    except ValueError:
+        return False
+    return time.time() - last_write < settings.db_read_your_writes_seconds
+
+
+async def open_read_session(use_primary: bool = False) -> AsyncSession:
+    """ Open a session for read-only work: on a replica if possible, otherwise on the primary. """
+
+    replica = None if use_primary else replica_set.choose()
+    if replica is not None:
+        session = AsyncSessionLocal(bind=replica)
+        try:
+            # Connect right away, so a replica that is down is noticed HERE
+            # (and we can fall back) instead of in the middle of the route.
+            await session.connection()
+            READS_ROUTED.inc(target=replica.pool.metrics_name)
+            return session
+        except (OSError, DBAPIError, PoolTimeoutError):
+            await session.close()
+            replica_set.mark_down(replica)
+
+    READS_ROUTED.inc(target="primary")
+    return AsyncSessionLocal()
+
+
+# Where get_read_db leaves the engine a request read from (see 'reads_are_fresh')
+READ_ENGINE_SCOPE_KEY = "db_read_engine"
+
+
+# The read-only counterpart of get_db, for routes that never write (e.g. GET /users).
+async def get_read_db(request: Request):
+    # Clients that just wrote something read from the primary, so they see their own change
+    session = await open_read_session(use_primary=wrote_recently(request))
+    request.scope[READ_ENGINE_SCOPE_KEY] = session.bind
+    async with session:
+        yield session
+
+
+async def reads_are_fresh(scope) -> bool:
+    """ True if this request read from the primary, or from a replica that is barely behind it. """
+
+    read_engine = scope.get(READ_ENGINE_SCOPE_KEY)
+    if read_engine is None or read_engine is engine:
+        return True
+    # A client that wrote something reads from the primary for a while; a replica answer
+    # for it may be older than its own write
+    if LAST_WRITE_COOKIE in Request(scope).cookies:
+        return False
+    lag = await replica_set.lag_seconds(read_engine)
+    return lag is not None and lag <= settings.response_cache_max_replica_lag_seconds
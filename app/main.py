@@ -1,21 +1,84 @@
 import time
+import logging
+import random
+import re
+import uuid
+# 'asynccontextmanager' turns a generator into the app's startup/shutdown hook ("lifespan").
+from contextlib import asynccontextmanager, suppress
+import asyncio
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from app.core.config import Settings
+from app.core.security import HashingBusyError
+# Queue-based JSON logging, and the per-request ID attached to every log line
+from app.core.logging_setup import start_logging, stop_logging, request_id_var
+# Per-route request counts and latency histograms (pure ASGI, very low overhead)
+from app.core.http_metrics import MetricsMiddleware
+# Serves repeated GETs from already-encoded responses
+from app.core.response_cache import ResponseCacheMiddleware
+# Request deadlines: stop work that nobody is waiting for any more
+from app.core.deadlines import DeadlineMiddleware, DeadlineExceeded, deadline_passed
+# Database errors that mean "too slow" or "no free connection"
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from asyncpg.exceptions import QueryCanceledError
+# Admin-only sampling profiler for single requests
+from app.core.profiler import ProfilingMiddleware
+# Per-request query counts / database time, and N+1 detection
+from app.db.query_stats import QueryStats, query_stats_var, DB_QUERIES_PER_REQUEST, N_PLUS_ONE_REQUESTS
+# The asyncpg pool used by the raw SQL service
+from app.db.database import close_pool
+# The batched audit log writer
+from app.services.audit_service import audit_pipeline
+# Creates upcoming (and drops expired) monthly audit partitions
+from app.db.partitions import run_partition_maintenance
 from app.routers.users import router as users_router
 # Import the authentication router
 from app.routers.auth import router as auth_router
 from app.routers.files import router as file_router
+from app.routers.metrics import router as metrics_router
+from app.routers.audit import router as audit_router
+from app.routers.profiles import router as profiles_router
 
 
 
 # 1. Initialize settings to get app name and debug mode
 settings = Settings()
 
+request_logger = logging.getLogger("app.request")
+error_logger = logging.getLogger("app.error")
+
+# A client-supplied X-Request-ID is reused only if it looks like an ID (no spaces, quotes, newlines...)
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+# Code before 'yield' runs once at startup, code after it once at shutdown.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the background thread that writes log lines
+    start_logging()
+    # Start the background task that saves audit events in batches
+    audit_pipeline.start()
+    # Make sure audit partitions exist for the coming months, and keep checking
+    partition_maintenance = asyncio.create_task(
+        run_partition_maintenance(settings.audit_partition_maintenance_interval_seconds)
+    )
+    yield
+    partition_maintenance.cancel()
+    # Wait until it has actually stopped (it may be in the middle of a transaction)
+    with suppress(asyncio.CancelledError):
+        await partition_maintenance
+    # Save every audit event that is still queued before the process exits
+    await audit_pipeline.stop()
+    # Close the raw SQL connection pool cleanly (it is only created if used)
+    await close_pool()
+    # Write out any log lines that are still queued
+    stop_logging()
+
+
 # 2. Create the core FastAPI application instance
 app = FastAPI(
     title=settings.app_name, # Sets the title shown in /docs
-    debug=settings.debug     # If True, shows detailed error pages to the developer
+    debug=settings.debug,    # If True, shows detailed error pages to the developer
+    lifespan=lifespan        # Startup/shutdown work (see above)
 )
 
 # 3. Connect the user-related routes (GET, POST, etc.) to the main app
@@ -25,42 +88,170 @@ app.include_router(users_router)
 app.include_router(auth_router)
 # 5. Connect the file-related routes to the main app
 app.include_router(file_router)
+# 6. Expose counters and gauges for monitoring (GET /metrics)
+app.include_router(metrics_router)
+# 7. Audit history for administrators (GET /audit)
+app.include_router(audit_router)
+# 8. Request profiles for administrators (GET /admin/profiles)
+app.include_router(profiles_router)
+
+# 9. Profile requests on demand (admins only). Added first so it is the INNERMOST
+# middleware: the route then runs in the same task, which is how samples are attributed.
+app.add_middleware(ProfilingMiddleware)
+# 10. Give every request a deadline and stop it when the deadline passes or the client leaves
+app.add_middleware(DeadlineMiddleware)
+# 11. Answer repeated GETs from the response cache (outside the deadline: hits need none)
+app.add_middleware(ResponseCacheMiddleware)
+# 12. Count and time every request per route (rendered on GET /metrics)
+app.add_middleware(MetricsMiddleware)
 
 
 # --- MIDDLEWARE: The "Monitor" ---
 # This function intercepts every single request coming into the server.
 @app.middleware("http")
 async def request_logging_middleware(request: Request, call_next):
-    # A. Record the exact time a request arrives
-    start_time = time.time()
+    # A. Give the request an ID (or keep the caller's), so all its log lines can be correlated.
+    # It is also kept on 'request.state' for the exception handler below, which runs outside this middleware.
+    request_id = request.headers.get("X-Request-ID", "")
+    if not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    request.state.request_id = request_id
+    token = request_id_var.set(request_id)
+    # Every SQL query run for this request is added to this object
+    query_stats = QueryStats()
+    stats_token = query_stats_var.set(query_stats)
 
-    # B. Send the request to the actual route (e.g., /users) and wait for response
-    response = await call_next(request)
+    # B. Record the time a request arrives ('perf_counter' is a precise clock that never jumps)
+    start_time = time.perf_counter()
+    try:
+        # C. Send the request to the actual route (e.g., /users) and wait for response
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+        query_stats_var.reset(stats_token)
 
-    # C. Calculate how many seconds it took to process
-    duration = time.time() - start_time
-
-    # D. Log the details to the console/Terminal (Method, Path, Status Code, and Time)
-    # Example: GET /users -> 200 [0.0045s]
-    print(
-        f"{request.method} {request.url.path} "
-        f"-> {response.status_code} "
-        f"[{duration:.4f}s]"
+    # D. Calculate how many milliseconds it took to process
+    duration_ms = (time.perf_counter() - start_time) * 1000
+    db_ms = query_stats.seconds * 1000
+    response.headers["X-Request-ID"] = request_id
+    # Shown per request in the browser's dev tools (Network -> Timing)
+    response.headers["Server-Timing"] = (
+        f'db;dur={db_ms:.2f};desc="{query_stats.count} queries", app;dur={duration_ms:.2f}'
     )
+    DB_QUERIES_PER_REQUEST.observe(query_stats.count)
+
+    # E. The same statement shape many times in one request is usually an N+1 pattern
+    route = request.scope.get("route")
+    route_path = getattr(route, "path", request.url.path)
+    repeated = query_stats.repeated_shapes(settings.sql_n_plus_one_threshold)
+    if repeated:
+        N_PLUS_ONE_REQUESTS.inc(route=route_path)
+        request_logger.warning(
+            "Possible N+1 queries",
+            extra={"request_id": request_id, "route": route_path, "repeated_statements": repeated},
+        )
+
+    # F. Errors and slow requests are always logged; other requests only as a sample.
+    # The log call only queues the record; a background thread writes it out.
+    slow = duration_ms >= settings.log_slow_request_ms
+    if response.status_code >= 400 or slow or repeated or random.random() < settings.log_sample_rate:
+        if response.status_code >= 500:
+            level = logging.ERROR
+        elif slow or repeated:
+            level = logging.WARNING
+        else:
+            level = logging.INFO
+        request_logger.log(
+            level,
+            "request",
+            extra={
+                "request_id": request_id,
+                "method": request.method,
+                "path": request.url.path,
+                "status": response.status_code,
+                "duration_ms": round(duration_ms, 2),
+                "db_queries": query_stats.count,
+                "db_ms": round(db_ms, 2),
+                "slow": slow,
+            },
+        )
 
     return response
 
+# --- EXCEPTION HANDLER: Password hashing pool is full ---
+# During a login storm we refuse extra work quickly instead of letting requests pile up.
+@app.exception_handler(HashingBusyError)
+async def hashing_busy_handler(request: Request, exc: HashingBusyError):
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "1"},
+        content={
+            "success": False,
+            "message": "Server is busy, please retry shortly"
+        }
+    )
+
+# --- EXCEPTION HANDLERS: The request ran out of time ---
+# Raised when a deadline has already passed before more work starts, when PostgreSQL
+# cancels a query because of 'statement_timeout', or when an asyncpg 'timeout' runs out.
+def gateway_timeout_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=504,
+        content={
+            "success": False,
+            "message": "The request took too long and was stopped"
+        }
+    )
+
+@app.exception_handler(DeadlineExceeded)
+@app.exception_handler(QueryCanceledError)
+async def deadline_exceeded_handler(request: Request, exc: Exception):
+    return gateway_timeout_response()
+
+# asyncpg calls get 'timeout=remaining()', so their TimeoutError means "deadline passed".
+# Any other timeout (connecting to PostgreSQL or MinIO, ...) is a real error.
+@app.exception_handler(TimeoutError)
+async def timeout_handler(request: Request, exc: TimeoutError):
+    if deadline_passed():
+        return gateway_timeout_response()
+    return await global_exception_handler(request, exc)
+
+# SQLAlchemy wraps driver errors; only "query canceled" (SQLSTATE 57014) is a timeout
+@app.exception_handler(DBAPIError)
+async def database_error_handler(request: Request, exc: DBAPIError):
+    if getattr(exc.orig, "sqlstate", None) == "57014":
+        return gateway_timeout_response()
+    return await global_exception_handler(request, exc)
+
+# --- EXCEPTION HANDLER: No free database connection in time ---
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "1"},
+        content={
+            "success": False,
+            "message": "Database is busy, please retry shortly"
+        }
+    )
+
 # --- EXCEPTION HANDLER: The "Safety Net" ---
 # If any code in your app crashes (like a DB error), this function catches it.
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    # Log the real error to the server console so developers can see it
-    print(f"Unhandled error: {exc}")
+    # Log the real error (with its traceback) so developers can see it
+    request_id = getattr(request.state, "request_id", None)
+    error_logger.error(
+        "Unhandled error",
+        exc_info=exc,
+        extra={"request_id": request_id, "method": request.method, "path": request.url.path},
+    )
 
     # Return a clean, polite JSON message to the user 
     # This prevents the user from seeing messy "traceback" code.
     return JSONResponse(
         status_code=500,
+        headers={"X-Request-ID": request_id} if request_id else None,
         content={
             "success": False,
             "message": "Internal server error"
@@ -1,2 +1,3 @@
 from app.models.user import User
 from app.models.address import Address
+from app.models.audit_event import AuditEvent
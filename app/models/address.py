@@ -17,7 +17,9 @@ class Address(Base):
     # 4. THE LINK (Foreign Key):
     # This column stores the 'id' of the user who owns this address.
     # If User #5 is deleted, this link helps the database maintain "Referential Integrity."
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    # 'index=True': "the addresses of these users" is a lookup by user_id, which
+    # would otherwise scan the whole table.
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
 
     # 5. RELATIONSHIP:
     # This sets up a relationship to the User model, allowing easy access to the user who owns this address.
@@ -0,0 +1,43 @@
+# 'DateTime(timezone=True)' stores a moment in time including its timezone (timestamptz).
+from datetime import datetime
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import BigInteger, DateTime, Index, String
+from app.db.base import Base
+
+# This class represents a single 'row' in the 'audit_events' table:
+# one record of something important that happened (who did what, and when).
+#
+# The table is split into one partition per month ("range partitioning" on created_at).
+# Queries filtered by time only read the matching months, and old months can be
+# removed instantly with DROP TABLE instead of a slow, table-wide DELETE.
+# The partitions themselves are managed by the migration and app/db/partitions.py.
+class AuditEvent(Base):
+    # 1. The name of the table in the database.
+    __tablename__ = "audit_events"
+
+    # 2. BigInteger, because an audit log can grow past 2 billion rows.
+    # On a partitioned table the primary key must include the partition key,
+    # so the key is (id, created_at); 'id' alone still comes from a sequence.
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+
+    # 3. When the event happened (set by the app when the event is recorded,
+    # not when it is finally written, so batching does not skew the time).
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+
+    # 4. What happened, e.g. 'CREATE_USER' or 'DELETE_USER'.
+    action: Mapped[str] = mapped_column(String, nullable=False)
+
+    # 5. Who did it (a username), or None for anonymous/system actions.
+    actor: Mapped[str | None] = mapped_column(String, nullable=True)
+
+    # 6. Free-form details, e.g. 'User 5 deleted'.
+    details: Mapped[str] = mapped_column(String, nullable=False)
+
+    __table_args__ = (
+        # A BRIN index stores only the min/max time per block of rows: very small,
+        # and a good fit for time ranges on a table that is only ever appended to.
+        Index("ix_audit_events_created_at_brin", "created_at", postgresql_using="brin"),
+        # Answers "what did actor X do (action Y) between A and B" without a scan.
+        Index("ix_audit_events_actor_action_created_at", "actor", "action", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
@@ -25,9 +25,14 @@ class User(Base):
     hashed_password: Mapped[str] = mapped_column(String, nullable=False)
     role: Mapped[str] = mapped_column(String, default="user", nullable=False)
 
+    # For ETags / optimistic concurrency: every write adds 1 (see app/core/etags.py).
+    # The write paths in both user services increase it in their UPDATE statements.
+    version: Mapped[int] = mapped_column(Integer, server_default="1", nullable=False)
+
     # 5. Relationship logic (Foreign Key link).
     # This doesn't exist as a physical column in the 'users' table. 
     # Instead, it's a "virtual" property that allows you to access a user's addresses like: my_user.addresses.
     # 'back_populates' ensures that if you change an address, the user object updates too.
-    addresses = relationship("Address", back_populates="user")
+    # 'order_by' keeps them in a stable order (so responses, and their ETags, do not change at random).
+    addresses = relationship("Address", back_populates="user", order_by="Address.id")
 
@@ -0,0 +1,40 @@
+# This file exposes the audit history to administrators.
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.dependencies import require_role
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.db.session import get_read_db
+from app.schemas.audit_response import AuditEventResponse
+from app.schemas.common import Page
+from app.services.audit_service import get_audit_events
+
+# Every route here requires the 'admin' role.
+router = APIRouter(
+    prefix="/audit",
+    tags=["Audit"],
+    dependencies=[Depends(require_role("admin"))]
+)
+
+
+# LIST: Audit events, newest first, e.g.
+#   GET /audit?actor=alice&action=DELETE_USER&since=2026-10-01T00:00:00Z
+@router.get("/", response_model=Page[AuditEventResponse])
+async def get_audit_events_api(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    actor: str | None = None,
+    action: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    try:
+        return await get_audit_events(
+            db, limit=limit, cursor=cursor, actor=actor, action=action, since=since, until=until
+        )
+    except ValueError as e:
+        # A tampered or malformed cursor
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,6 +1,6 @@
 # This file defines authentication-related API routes, such as user registration.
 # This router handles incoming requests and delegates to service functions for processing.
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 
 # AsyncSession: Type hint for our non-blocking database connection
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -10,7 +10,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
 
 # This module handles password hashing and JWT token creation/verification.
-from app.core.security import verify_password, create_access_token
+# 'verify_password_async' runs bcrypt in a worker thread so the server stays responsive.
+from app.core.security import verify_password_async, create_access_token
 
 # 'select' is the tool used to write database queries (like searching for users).
 from sqlalchemy import select
@@ -32,6 +33,67 @@ from app.services.user_service import register_user
 from app.core.dependencies import get_current_user
 # The User database model
 from app.models.user import User
+# The authenticated user returned by get_current_user
+from app.schemas.user_response import CurrentUser
+
+# In-memory login throttling (token buckets per username and per client IP)
+from app.core.rate_limit import TokenBucketLimiter, retry_after_header
+from app.core.config import settings
+from app.core.metrics import Counter
+
+# --- LOGIN THROTTLING ---
+# Every login attempt costs a full bcrypt verification, our most expensive operation.
+# These limiters turn away credential-stuffing bursts before any of that work happens.
+username_limiter = TokenBucketLimiter(
+    limit=settings.login_rate_limit_per_username,
+    period_seconds=settings.login_rate_limit_period_seconds,
+    max_keys=settings.login_rate_limit_max_keys,
+)
+ip_limiter = TokenBucketLimiter(
+    limit=settings.login_rate_limit_per_ip,
+    period_seconds=settings.login_rate_limit_period_seconds,
+    max_keys=settings.login_rate_limit_max_keys,
+)
+LOGIN_THROTTLED = Counter("app_login_throttled_total", "Login attempts rejected by rate limiting.", ("limit",))
+
+
+def client_ip(request: Request) -> str:
+    """ The client's address: the peer itself, or the client a trusted proxy forwarded for. """
+
+    peer = request.client.host if request.client else "unknown"
+    if peer not in settings.login_trusted_proxies:
+        return peer
+    # Each proxy appends the address it received the request from, so the last
+    # entry that is not one of our own proxies is the real client
+    forwarded = request.headers.get(settings.login_client_ip_header, "")
+    for address in reversed([part.strip() for part in forwarded.split(",") if part.strip()]):
+        if address not in settings.login_trusted_proxies:
+            return address
+    return peer
+
+
+def check_login_rate_limit(username: str, client_ip: str):
+    # The IP bucket catches one client trying many usernames,
+    # the username bucket catches many clients trying one account.
+    for limit, limiter, key in (
+        ("ip", ip_limiter, client_ip),
+        ("username", username_limiter, username.lower()),
+    ):
+        retry_after = limiter.hit(key)
+        if retry_after:
+            LOGIN_THROTTLED.inc(limit=limit)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, please try again later",
+                headers=retry_after_header(retry_after),
+            )
+
+
+def refund_login_attempt(username: str, client_ip: str):
+    # Only failed attempts should count: a user who logs in correctly gets the token back
+    ip_limiter.refund(client_ip)
+    username_limiter.refund(username.lower())
+
 
 # --- ROUTER SETUP ---
 router = APIRouter(
@@ -60,7 +122,11 @@ async def register(user: UserRegister, db: AsyncSession = Depends(get_db)):
 # This endpoint allows users to log in and receive an access token
 @router.post("/login")
 # This handles user login requests, returning a JWT token upon successful authentication
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+
+    # Reject excess attempts first: this is cheaper than the query and the hash below
+    ip = client_ip(request)
+    check_login_rate_limit(form_data.username, ip)
 
 # Look up the user by username
     result = await db.execute(
@@ -72,14 +138,17 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
 
 
     # Throw error if user not found or password incorrect
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
+    refund_login_attempt(form_data.username, ip)
     # Create JWT token for the authenticated user
+    # 'username' and 'role' are included so that, when enabled, protected routes
+    # can authorize from the signed token alone without a database lookup.
     access_token = create_access_token(
-        data={"sub": str(user.id)}
+        data={"sub": str(user.id), "username": user.username, "role": user.role}
     )
 
     return {
@@ -93,7 +162,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
 
 # This endpoint returns information about the currently authenticated user
 @router.get("/me")
-async def read_me(current_user: User = Depends(get_current_user)):
+async def read_me(current_user: CurrentUser = Depends(get_current_user)):
     return {
         "id": current_user.id,
         "username": current_user.username,
@@ -6,8 +6,8 @@ from datetime import timedelta
 from app.core.storage import minio_client, BUCKET_NAME
 # Import the dependency that gets the current logged-in user.
 from app.core.dependencies import get_current_user
-# user model to type hint the current user.
-from app.models.user import User
+# The authenticated user type, to type hint the current user.
+from app.schemas.user_response import CurrentUser
 
 # Group these routes under "/files" and label them "Files" in the Swagger docs.
 router = APIRouter(prefix="/files", tags=["Files"])
@@ -16,7 +16,7 @@ router = APIRouter(prefix="/files", tags=["Files"])
 def generate_upload_url(
     filename: str, 
     # Ensure the person requesting a link is a logged-in user.
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     # Organizes files in the bucket by User ID (e.g., "user123/my_photo.png").
     # This prevents users from overwriting each other's files.
@@ -47,7 +47,7 @@ def generate_upload_url(
 def generate_download_url(
     object_name: str, 
     # Only logged-in users can request a download link.
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     # SECURITY CHECK: This is the most important part!
     # It ensures the user is only requesting a file from THEIR OWN "folder".
@@ -0,0 +1,16 @@
+# This file exposes the application's metrics for monitoring tools.
+# Prometheus (or any compatible scraper) polls GET /metrics periodically.
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+# The registry that renders all counters and gauges as text
+from app.core.metrics import generate_latest
+
+# Not part of the public API, so it is hidden from the Swagger docs.
+router = APIRouter(tags=["Monitoring"], include_in_schema=False)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # The content type tells Prometheus which text format version this is
+    return PlainTextResponse(generate_latest(), media_type="text/plain; version=0.0.4")
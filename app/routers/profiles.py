@@ -0,0 +1,32 @@
+# This file lets administrators download request profiles taken by app.core.profiler.
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import PlainTextResponse
+
+from app.core.dependencies import require_role
+from app.core.profiler import profile_store
+
+# Every route here requires the 'admin' role.
+router = APIRouter(
+    prefix="/admin/profiles",
+    tags=["Admin"],
+    dependencies=[Depends(require_role("admin"))]
+)
+
+
+# LIST: The stored profiles, newest first (without their samples)
+@router.get("/")
+async def list_profiles_api():
+    return [profile.summary() for profile in profile_store.list()]
+
+
+# READ ONE: A profile as speedscope JSON (open it at https://www.speedscope.app)
+# or as collapsed stacks (for flamegraph.pl and other flame graph tools)
+@router.get("/{profile_id}")
+async def get_profile_api(profile_id: str, format: str = Query("speedscope", pattern="^(speedscope|collapsed)$")):
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    return profile.speedscope()
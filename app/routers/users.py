@@ -1,11 +1,36 @@
 # APIRouter: Groups your routes; HTTPException: Sends error codes; Depends: Injects database sessions
 from fastapi import APIRouter, HTTPException, Depends
+# Header: Declares a request header parameter (e.g. If-None-Match); Response: Lets a route set headers
+from fastapi import Header, Response
+# Query: Declares (and validates) URL query parameters such as ?limit=50
+from fastapi import Query
+# Body: Declares that a parameter comes from the JSON request body
+from fastapi import Body
+# StreamingResponse: Sends the body piece by piece instead of building it all in memory
+from fastapi.responses import StreamingResponse
 # AsyncSession: Type hint for our non-blocking database connection
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # Pydantic Schemas: Define how data should look for requests and responses
-from app.schemas.user_request import UserCreate, UserUpdate
-from app.schemas.user_response import UserResponse
+from app.schemas.user_request import UserCreate, UserUpdate, validate_user_batch, taken_username_errors
+from app.schemas.user_response import UserResponse, BulkCreateResponse, parse_user_fields
+from app.schemas.user_response import UserWithAddressesResponse, parse_user_includes
+from app.schemas.user_response import USER_PAGE_RESPONSES, USER_RESPONSES
+from app.schemas.common import Page
+
+# Page size limits shared with the raw SQL routes
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.core.config import settings
+from app.services.export_service import EXPORT_MEDIA_TYPES, encode_rows
+from app.services.audit_service import audit_log
+# Long-running streams opt out of the request deadline
+from app.core.deadlines import deadline, no_deadline
+# ETags for conditional GETs (304) and conditional writes (412)
+from app.core.etags import user_etag, page_etag, none_match, expected_versions
+# Lets GET routes keep their encoded responses in the response cache
+from app.core.response_cache import cached
+# Sends already JSON-ready rows without response_model validation (fast read path)
+from app.core.responses import FastJSONResponse, conditional_json_response, conditional_response
 
 
 from app.core.dependencies import require_role # Role-based access control dependency
@@ -13,14 +38,18 @@ from app.core.dependencies import require_role # Role-based access control depen
 # Service Functions: The logic that actually talks to PostgreSQL
 from app.services.user_service import (
     create_user,
+    create_users_bulk,
     get_all_users,
+    stream_users,
     get_user_by_id,
+    get_user_addresses,
     update_user,
     delete_user
 )
 
-# Database Dependency: Opens and closes the session for each request
-from app.db.session import get_db
+# Database Dependencies: Open and close the session for each request.
+# 'get_read_db' is for read-only routes and may use a read replica.
+from app.db.session import get_db, get_read_db
 
 # --- ROUTER SETUP ---
 router = APIRouter(
@@ -36,27 +65,153 @@ router = APIRouter(
     # Calls the service and waits for the database to save the user
 #    return await create_user(db, user)
 
-# 2. READ ALL: Get a list of all users
-@router.get("/", response_model=list[UserResponse])
-async def get_users_api(db: AsyncSession = Depends(get_db)):
-    # Fetches all users and automatically converts them to a JSON list
-    return await get_all_users(db)
+# 1b. BULK CREATE: Create many users in one request and one transaction
+# Items are validated one by one, so a single bad item is reported instead of rejecting the batch.
+# Hashing every password takes a while, so the route may use the longest deadline allowed
+@router.post(
+    "/bulk", response_model=BulkCreateResponse,
+    dependencies=[Depends(deadline(settings.request_timeout_max_seconds))],
+)
+async def create_users_bulk_api(items: list = Body(...), db: AsyncSession = Depends(get_db)):
+    if len(items) > settings.bulk_max_items:
+        raise HTTPException(status_code=413, detail=f"At most {settings.bulk_max_items} items per request")
+
+    valid, errors = validate_user_batch(items)
+    created = await create_users_bulk(
+        db, [user for _, user in valid], chunk_size=settings.bulk_insert_chunk_size
+    )
+    # Valid items whose username was already taken are errors too
+    errors = sorted(errors + taken_username_errors(valid, created), key=lambda error: error["index"])
+    return {"created": created, "errors": errors}
+
+# 2. READ ALL: Get one page of users
+# Clients walk the table by passing the 'next_cursor' of one page as '?cursor=' for the next.
+# The encoded page is cached; any user write purges the "users" tag.
+@router.get("/", response_model=None, responses=USER_PAGE_RESPONSES, dependencies=[Depends(cached("users"))])
+async def get_users_api(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    include_total: bool = False,
+    fields: str | None = Query(
+        None, description="Only these fields (of id, name, age, version), e.g. 'id,name'. Not with 'include'."
+    ),
+    include: str | None = Query(None, description="Related data to embed: 'addresses'. Not with 'fields'."),
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_read_db)
+):
+    try:
+        selected = parse_user_fields(fields)
+        includes = parse_user_includes(include)
+        if selected is not None and includes:
+            raise ValueError("'fields' and 'include' cannot be combined")
+        # Fetches a single page (as plain row dicts on the fast read path)
+        page = await get_all_users(
+            db, limit=limit, cursor=cursor, include_total=include_total,
+            as_rows=settings.users_fast_read_path, fields=selected,
+            include_addresses="addresses" in includes,
+        )
+    # A cursor that cannot be decoded (or an unknown field) is the client's mistake, not a server error
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Embedded addresses: UserResponse has no room for them, so the page is encoded
+    # with the nested schema here (the addresses were loaded with one extra query)
+    if includes:
+        body = Page[UserWithAddressesResponse].model_validate(page).model_dump_json()
+        return conditional_response(body.encode(), if_none_match)
+
+    # Sparse fieldset: the rows have only the requested fields, so UserResponse does not
+    # apply; they are sent as they are
+    if selected is not None:
+        return conditional_json_response(page, if_none_match)
+
+    # The client already has this exact page: answer 304 without building the JSON body
+    etag = page_etag(page)
+    if none_match(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    if settings.users_fast_read_path:
+        # The rows already have exactly the response's shape: encode them as they are
+        return FastJSONResponse(page, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    # Automatically converted to JSON
+    return page
+
+# EXPORT: Stream the whole users table as NDJSON or CSV
+# Declared before '/{user_id}' so that "export" is not mistaken for a user ID.
+@router.get("/export", dependencies=[Depends(no_deadline)])
+async def export_users_api(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    batch_size: int = Query(settings.export_batch_size, ge=1, le=10000),
+):
+    # Rows flow straight from the server-side cursor to the client, one batch at a time
+    return StreamingResponse(
+        encode_rows(stream_users(batch_size), format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+    )
 
 # 3. READ ONE: Get a single user by their ID
-@router.get("/{user_id}", response_model=UserResponse)
-async def get_user_api(user_id: int, db: AsyncSession = Depends(get_db)):
-    user = await get_user_by_id(db, user_id)
+@router.get(
+    "/{user_id}", response_model=None, responses=USER_RESPONSES, dependencies=[Depends(cached("user:{user_id}"))]
+)
+async def get_user_api(
+    user_id: int,
+    response: Response,
+    fields: str | None = Query(
+        None, description="Only these fields (of id, name, age, version), e.g. 'id,name'. Not with 'include'."
+    ),
+    include: str | None = Query(None, description="Related data to embed: 'addresses'. Not with 'fields'."),
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+):
+    try:
+        selected = parse_user_fields(fields)
+        includes = parse_user_includes(include)
+        if selected is not None and includes:
+            raise ValueError("'fields' and 'include' cannot be combined")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Usually answered from the user cache, so an unchanged user costs no query at all
+    user = await get_user_by_id(db, user_id, fields=selected)
     if not user:
         # Returns a 404 error if the ID doesn't exist in the DB
         raise HTTPException(status_code=404, detail="User not found")
+    if selected is not None:
+        return conditional_json_response(user, if_none_match)
+    if includes:
+        # One more (indexed) query for this user's addresses
+        addresses = await get_user_addresses(db, user_id)
+        body = UserWithAddressesResponse(**user, addresses=addresses).model_dump_json()
+        return conditional_response(body.encode(), if_none_match)
+
+    # The client's copy is still current: 304 with no body (and no serialization)
+    etag = user_etag(user["id"], user["version"])
+    if none_match(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return user
 
 # 4. UPDATE: Change details for an existing user
 @router.put("/{user_id}", response_model=UserResponse)
-async def update_user_api(user_id: int, user: UserUpdate, db: AsyncSession = Depends(get_db)):
-    updated_user = await update_user(db, user_id, user)
+# With 'If-Match: <etag>' the update only happens if nobody changed the user since the
+# client read it; otherwise 412, and the client should fetch the user again.
+async def update_user_api(
+    user_id: int,
+    user: UserUpdate,
+    response: Response,
+    if_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_db),
+):
+    updated_user = await update_user(db, user_id, user, versions=expected_versions(if_match, user_id))
     if not updated_user:
+        if if_match:
+            raise HTTPException(status_code=412, detail="User was changed by someone else")
         raise HTTPException(status_code=404, detail="User not found")
+
+    # The new ETag, so the client can make its next conditional request
+    response.headers["ETag"] = user_etag(updated_user.id, updated_user.version)
     return updated_user
 
 
@@ -64,9 +219,19 @@ async def update_user_api(user_id: int, user: UserUpdate, db: AsyncSession = Dep
 @router.delete("/{user_id}")
 
 # This endpoint requires the current user to have the 'admin' role, enforced by the 'require_role' dependency.
-async def delete_user_api(user_id: int, db: AsyncSession = Depends(get_db), current_user=Depends(require_role("admin"))):
-    success = await delete_user(db, user_id)
+# 'If-Match' works as for PUT.
+async def delete_user_api(
+    user_id: int,
+    if_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(require_role("admin")),
+):
+    success = await delete_user(db, user_id, versions=expected_versions(if_match, user_id))
     if not success:
+        if if_match:
+            raise HTTPException(status_code=412, detail="User was changed by someone else")
         raise HTTPException(status_code=404, detail="User not found")
+    # Record who deleted whom (queued; saved to 'audit_events' in the background)
+    await audit_log("DELETE_USER", f"User {user_id} deleted", actor=current_user.username)
     # Returns a simple confirmation message
     return {"message": "User deleted successfully"}
\ No newline at end of file
@@ -1,12 +1,33 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from app.schemas.user_request import UserCreate
+from fastapi import APIRouter, HTTPException, Query, Body, Depends, Header, Response
+from fastapi.responses import StreamingResponse
+from app.schemas.user_request import UserCreate, validate_user_batch, taken_username_errors
 from app.schemas.user_request import UserUpdate
-from app.schemas.user_response import UserResponse
+from app.schemas.user_response import UserResponse, BulkCreateResponse, parse_user_fields
+from app.schemas.user_response import UserWithAddressesResponse, parse_user_includes
+from app.schemas.user_response import USER_PAGE_RESPONSES, USER_RESPONSES
+from app.schemas.common import Page
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.core.config import settings
+from app.services.export_service import EXPORT_MEDIA_TYPES, encode_rows
 from app.services.audit_service import audit_log
-from app.services.user_service import (
+# Long-running streams opt out of the request deadline
+from app.core.deadlines import deadline, no_deadline
+# ETags for conditional GETs (304) and conditional writes (412)
+from app.core.etags import user_etag, page_etag, none_match, expected_versions
+# Lets GET routes keep their encoded responses in the response cache
+from app.core.response_cache import cached
+# Sends sparse (some fields only) answers as they are, with an ETag of the body
+from app.core.responses import conditional_json_response, conditional_response
+# The hand-written SQL service (asyncpg), NOT the ORM one.
+# Every handler below is 'async def', so requests never occupy a worker thread
+# while they wait for PostgreSQL.
+from app.services.user_service_raw import (
     create_user,
+    create_users_bulk,
     get_all_users,
+    stream_users,
     get_user_by_id,
+    get_user_addresses,
     update_user,
     delete_user
 )
@@ -20,49 +41,156 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=UserResponse)
-def create_user_api(user: UserCreate, background_tasks: BackgroundTasks):
+async def create_user_api(user: UserCreate):
     # 1. Call the database logic to save the user
-    new_user = create_user(user)
+    try:
+        new_user = await create_user(user)
+    except ValueError as e:
+        # The username is taken
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # 2. Schedule the slow 'audit_log' to run in the background.
-    # This allows the API to return a response immediately without waiting 1 second.
-    background_tasks.add_task(audit_log, "CREATE_USER", f"User {new_user.id} created")
+    # 2. Record the event. This only puts it on the audit queue (no database wait);
+    # the audit writer saves queued events in batches in the background.
+    await audit_log("CREATE_USER", f"User {new_user.id} created")
     
     # 3. Return the new user (FastAPI automatically formats this as UserResponse)
     return new_user
 
 
-@router.get("/", response_model=list[UserResponse])
-def get_users_api():
-    # Simply calls the service and returns the list of user objects.
-    return get_all_users()
+# Hashing every password takes a while, so the route may use the longest deadline allowed
+@router.post(
+    "/bulk", response_model=BulkCreateResponse,
+    dependencies=[Depends(deadline(settings.request_timeout_max_seconds))],
+)
+async def create_users_bulk_api(items: list = Body(...)):
+    if len(items) > settings.bulk_max_items:
+        raise HTTPException(status_code=413, detail=f"At most {settings.bulk_max_items} items per request")
+
+    # Validate everything first, then write all valid users in a single transaction
+    valid, errors = validate_user_batch(items)
+    created = await create_users_bulk([user for _, user in valid], chunk_size=settings.bulk_insert_chunk_size)
+    errors = sorted(errors + taken_username_errors(valid, created), key=lambda error: error["index"])
+    return {"created": created, "errors": errors}
+
+
+@router.get("/", response_model=None, responses=USER_PAGE_RESPONSES, dependencies=[Depends(cached("users"))])
+async def get_users_api(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    include_total: bool = False,
+    fields: str | None = Query(
+        None, description="Only these fields (of id, name, age, version), e.g. 'id,name'. Not with 'include'."
+    ),
+    include: str | None = Query(None, description="Related data to embed: 'addresses'. Not with 'fields'."),
+    if_none_match: str | None = Header(None),
+):
+    # Calls the service and returns a single page of user objects.
+    try:
+        selected = parse_user_fields(fields)
+        includes = parse_user_includes(include)
+        if selected is not None and includes:
+            raise ValueError("'fields' and 'include' cannot be combined")
+        page = await get_all_users(
+            limit=limit, cursor=cursor, include_total=include_total, fields=selected,
+            include_addresses="addresses" in includes,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Users with embedded addresses (loaded with one grouped query) do not fit UserResponse
+    if includes:
+        body = Page[UserWithAddressesResponse].model_validate(page).model_dump_json()
+        return conditional_response(body.encode(), if_none_match)
+
+    # Only the requested fields were selected; send them as they are
+    if selected is not None:
+        return conditional_json_response(page, if_none_match)
+
+    # Unchanged page -> 304 Not Modified, no body
+    etag = page_etag(page)
+    if none_match(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return page
 
 
-@router.get("/{user_id}", response_model=UserResponse)
-def get_user_api(user_id: int):
-    user = get_user_by_id(user_id)
+@router.get("/export", dependencies=[Depends(no_deadline)])
+async def export_users_api(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    batch_size: int = Query(settings.export_batch_size, ge=1, le=10000),
+):
+    # Rows flow straight from the server-side cursor to the client, one batch at a time
+    return StreamingResponse(
+        encode_rows(stream_users(batch_size), format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+    )
+
+
+@router.get(
+    "/{user_id}", response_model=None, responses=USER_RESPONSES, dependencies=[Depends(cached("user:{user_id}"))]
+)
+async def get_user_api(
+    user_id: int,
+    response: Response,
+    fields: str | None = Query(
+        None, description="Only these fields (of id, name, age, version), e.g. 'id,name'. Not with 'include'."
+    ),
+    include: str | None = Query(None, description="Related data to embed: 'addresses'. Not with 'fields'."),
+    if_none_match: str | None = Header(None),
+):
+    try:
+        selected = parse_user_fields(fields)
+        includes = parse_user_includes(include)
+        if selected is not None and includes:
+            raise ValueError("'fields' and 'include' cannot be combined")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    user = await get_user_by_id(user_id, fields=selected)
     # Error Handling: If the database returns None, we stop and send a 404 error.
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    if selected is not None:
+        return conditional_json_response(user, if_none_match)
+    if includes:
+        addresses = await get_user_addresses(user_id)
+        body = UserWithAddressesResponse(**user.model_dump(), addresses=addresses).model_dump_json()
+        return conditional_response(body.encode(), if_none_match)
+
+    # Unchanged user -> 304 Not Modified, no body
+    etag = user_etag(user.id, user.version)
+    if none_match(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return user
 
 
 @router.put("/{user_id}", response_model=UserResponse)
-def update_user_api(user_id: int, user: UserUpdate):
+async def update_user_api(user_id: int, user: UserUpdate, response: Response, if_match: str | None = Header(None)):
     # Passes both the 'Who' (user_id) and the 'What' (user) to the service.
-    updated_user = update_user(user_id, user)
+    # With 'If-Match', the update only happens if the user is still at that version.
+    updated_user = await update_user(user_id, user, versions=expected_versions(if_match, user_id))
     
     if not updated_user:
+        if if_match:
+            raise HTTPException(status_code=412, detail="User was changed by someone else")
         raise HTTPException(status_code=404, detail="User not found")
+    response.headers["ETag"] = user_etag(updated_user.id, updated_user.version)
     return updated_user
 
 
 @router.delete("/{user_id}")
-def delete_user_api(user_id: int):
-    success = delete_user(user_id)
+async def delete_user_api(user_id: int, if_match: str | None = Header(None)):
+    success = await delete_user(user_id, versions=expected_versions(if_match, user_id))
     
     if not success:
+        if if_match:
+            raise HTTPException(status_code=412, detail="User was changed by someone else")
         raise HTTPException(status_code=404, detail="User not found")
+
+    await audit_log("DELETE_USER", f"User {user_id} deleted")
     
     # Returns a simple confirmation message instead of a full UserResponse.
     return {"message": "User deleted successfully"}
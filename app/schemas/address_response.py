@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+# One address as it appears inside a user (GET /users/{id}?include=addresses).
+# The owner is the surrounding user, so 'user_id' is not repeated here.
+class AddressResponse(BaseModel):
+    id: int
+    email: str
@@ -0,0 +1,12 @@
+from datetime import datetime
+from pydantic import BaseModel
+
+# One entry of the audit log, as returned by GET /audit
+class AuditEventResponse(BaseModel):
+    id: int
+    created_at: datetime
+    # e.g. 'DELETE_USER'
+    action: str
+    # The username that did it, or None for anonymous requests
+    actor: str | None = None
+    details: str
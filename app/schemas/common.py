@@ -20,4 +20,19 @@ class APIResponse(BaseModel, Generic[T]):
     # - It can be of type T (the data we are sending back).
     # - It can be None (useful for errors where there is no data to return).
     # - It defaults to None if we don't provide it.
-    data: T | None = None
\ No newline at end of file
+    data: T | None = None
+
+# A single "page" of results returned by keyset (cursor) pagination.
+# Instead of the whole table, the client gets 'limit' items plus a cursor
+# that it sends back (?cursor=...) to fetch the next page.
+class Page(BaseModel, Generic[T]):
+
+    # 1. The rows on this page.
+    items: list[T]
+
+    # 2. Opaque token for the next page, or None when this is the last page.
+    next_cursor: str | None = None
+
+    # 3. Approximate number of rows in the whole table (from Postgres statistics).
+    # Only filled in when the client asks for it, because it is an estimate, not a COUNT(*).
+    estimated_total: int | None = None
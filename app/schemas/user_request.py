@@ -1,11 +1,14 @@
 # This file defines Pydantic schemas for user-related requests.
 # These schemas are used to validate and structure data for creating and updating users.
-from pydantic import BaseModel, field_validator, Field
+from pydantic import BaseModel, field_validator, Field, ValidationError
 from typing import Optional
 
 class UserCreate(BaseModel):
     name: str  # Must be a string
     age: int   # Must be an integer
+    # Every user can log in, so it needs credentials (the password is stored hashed)
+    username: str = Field(..., min_length=3)
+    password: str = Field(..., min_length=6)
 
     # --- CUSTOM VALIDATION ---
     # This function runs automatically whenever a new UserCreate is made
@@ -21,6 +24,49 @@ class UserCreate(BaseModel):
         return v
 
 
+def _username_error(index: int, username: str, message: str) -> dict:
+    return {
+        "index": index,
+        "errors": [{"type": "username_taken", "loc": ["username"], "msg": message, "input": username}],
+    }
+
+
+# Validates a whole batch of raw payloads (e.g. from POST /users/bulk) in one pass.
+# Instead of failing the entire request on the first bad item, it returns the valid
+# users together with their position, and a list of errors keyed by position.
+def validate_user_batch(items: list) -> tuple[list[tuple[int, UserCreate]], list[dict]]:
+    valid = []
+    errors = []
+    usernames = set()
+    for index, item in enumerate(items):
+        try:
+            user = UserCreate.model_validate(item)
+        except ValidationError as e:
+            errors.append({
+                "index": index,
+                "errors": e.errors(include_url=False, include_context=False),
+            })
+            continue
+        # Only the first item may claim a username
+        if user.username in usernames:
+            errors.append(_username_error(index, user.username, "Username appears more than once in this request"))
+            continue
+        usernames.add(user.username)
+        valid.append((index, user))
+    return valid, errors
+
+
+# After a bulk insert: the valid items whose username was already taken in the database
+# (the insert skips them) are reported like any other invalid item.
+def taken_username_errors(valid: list[tuple[int, UserCreate]], created: list[dict]) -> list[dict]:
+    created_usernames = {row["username"] for row in created}
+    return [
+        _username_error(index, user.username, "Username already exists")
+        for index, user in valid
+        if user.username not in created_usernames
+    ]
+
+
 class UserUpdate(BaseModel):
     # 'Optional' and '= None' mean these fields are NOT required.
     # This allows for "Partial Updates" (e.g., updating the name without changing the age).
@@ -1,6 +1,9 @@
 
 from pydantic import BaseModel
 
+from app.schemas.address_response import AddressResponse
+from app.schemas.common import Page
+
 # This class defines the structure of the JSON data that will be 
 # sent BACK to the user after a successful request.
 class UserResponse(BaseModel):
@@ -14,4 +17,105 @@ class UserResponse(BaseModel):
     name: str
     
     # 3. The user's age as an integer.
-    age: int
\ No newline at end of file
+    age: int
+
+    # 4. Increases with every change to the user (the ETag is built from it).
+    version: int
+
+
+# A user together with its addresses ('?include=addresses').
+class UserWithAddressesResponse(UserResponse):
+    addresses: list[AddressResponse]
+
+
+# A user with only the fields picked with '?fields=' (sparse fieldsets).
+# Only used to document that shape; such responses are built from plain rows.
+class SparseUserResponse(BaseModel):
+    id: int | None = None
+    name: str | None = None
+    age: int | None = None
+    version: int | None = None
+
+
+# The fields a client may pick with '?fields=' (sparse fieldsets), in response order.
+USER_FIELDS = ("id", "name", "age", "version")
+
+
+# The shapes GET /users/ and GET /users/{id} may return, for the OpenAPI docs ('responses=').
+# The routes pick one per request, so they have no single 'response_model'.
+USER_PAGE_RESPONSES = {
+    200: {
+        "model": Page[UserResponse] | Page[UserWithAddressesResponse] | Page[SparseUserResponse],
+        "description": (
+            "One page of users. With '?include=addresses' every user also has its 'addresses'; "
+            "with '?fields=' users have only the requested fields."
+        ),
+    },
+}
+USER_RESPONSES = {
+    200: {
+        "model": UserResponse | UserWithAddressesResponse | SparseUserResponse,
+        "description": (
+            "The user. With '?include=addresses' it also has its 'addresses'; "
+            "with '?fields=' it has only the requested fields."
+        ),
+    },
+}
+
+
+def parse_user_fields(fields: str | None) -> tuple[str, ...] | None:
+    """
+    Turn '?fields=name,id' into ('id', 'name'); None when the client wants every field.
+    Raises ValueError for unknown fields, and for a list without any field (e.g. '?fields=,').
+    """
+
+    if fields is None or not fields.strip():
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    if not requested:
+        raise ValueError(f"No fields requested. Choose from: {', '.join(USER_FIELDS)}")
+    unknown = requested - set(USER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(sorted(unknown))}. Choose from: {', '.join(USER_FIELDS)}")
+    return tuple(name for name in USER_FIELDS if name in requested)
+
+
+# Related data a client may ask to be embedded with '?include='.
+USER_INCLUDES = ("addresses",)
+
+
+def parse_user_includes(include: str | None) -> tuple[str, ...]:
+    """ Turn '?include=addresses' into ('addresses',). Raises ValueError for unknown names. """
+
+    if include is None:
+        return ()
+    requested = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = requested - set(USER_INCLUDES)
+    if unknown:
+        raise ValueError(f"Cannot include: {', '.join(sorted(unknown))}. Choose from: {', '.join(USER_INCLUDES)}")
+    return tuple(name for name in USER_INCLUDES if name in requested)
+
+
+# The authenticated user as seen by route dependencies (get_current_user, require_role).
+# It carries only what authorization needs, so it can be cached or rebuilt from JWT claims
+# without loading the full database row.
+class CurrentUser(BaseModel):
+    id: int
+    username: str
+    role: str
+
+
+# Describes why one item of a bulk request was rejected.
+class BulkItemError(BaseModel):
+
+    # 1. Position of the item in the submitted list (0-based).
+    index: int
+
+    # 2. The validation errors for that item (same shape as FastAPI's 422 details).
+    errors: list[dict]
+
+
+# The result of POST /users/bulk: what was created and what was rejected.
+class BulkCreateResponse(BaseModel):
+    created: list[UserResponse]
+    errors: list[BulkItemError]
@@ -1,18 +1,368 @@
-import time
+# This module records important events (who did what, and when) in the 'audit_events' table.
+# Handlers never wait for the database here: 'audit_log' only puts the event on an
+# in-memory queue, and ONE background task (the "writer") saves queued events in batches.
+# One multi-row INSERT for hundreds of events is far cheaper than one INSERT per event.
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.pagination import DEFAULT_PAGE_SIZE, encode_time_cursor, decode_time_cursor
+from app.core.metrics import Counter, Gauge, Histogram
+from app.db.session import engine
+from app.models.audit_event import AuditEvent
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+logger = logging.getLogger("app.audit")
+
+# --- Metrics (rendered on GET /metrics) ---
+AUDIT_ENQUEUED = Counter("app_audit_events_enqueued_total", "Audit events accepted by audit_log.")
+AUDIT_WRITTEN = Counter("app_audit_events_written_total", "Audit events saved to the database.")
+AUDIT_DROPPED = Counter("app_audit_events_dropped_total", "Audit events lost, by reason.", ("reason",))
+AUDIT_SPILLED = Counter("app_audit_events_spilled_total", "Audit events written to the spill file.")
+AUDIT_QUEUE_DEPTH = Gauge("app_audit_queue_depth", "Audit events waiting to be saved.")
+AUDIT_FLUSH_SECONDS = Histogram("app_audit_flush_seconds", "Time spent saving one batch of audit events.")
+
+
+class AuditPipeline:
+    """ A bounded queue of audit events plus the single task that saves them in batches. """
+
+    def __init__(
+        self,
+        maxsize: int,
+        batch_size: int,
+        flush_interval: float,
+        overflow_policy: str,
+        spill_path: str,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown audit overflow policy '{overflow_policy}', choose from {OVERFLOW_POLICIES}")
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+        # Created in 'start', because an asyncio.Queue belongs to the running event loop
+        self._queue: asyncio.Queue | None = None
+        self._queue_loop: asyncio.AbstractEventLoop | None = None
+        self._writer: asyncio.Task | None = None
+        self._stopping = False
+        # Appending to the spill file and moving it aside for a replay must not overlap
+        self._spill_lock = asyncio.Lock()
+
+    # --- LIFECYCLE ---
+    def start(self):
+        """ Start the background writer (called from the app lifespan, or lazily on first use). """
+
+        if self._writer is not None and not self._writer.done():
+            return
+        # A writer that died leaves its queue behind: keep it, the events in it still
+        # have to be saved. Only a queue of another (finished) event loop is replaced,
+        # and its events are moved over.
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._queue_loop is not loop:
+            queue = asyncio.Queue(maxsize=self.maxsize)
+            while self._queue is not None and not self._queue.empty() and not queue.full():
+                queue.put_nowait(self._queue.get_nowait())
+            self._queue = queue
+            self._queue_loop = loop
+        self._stopping = False
+        self._writer = asyncio.create_task(self._run(), name="audit-writer")
+
+    async def stop(self):
+        """ Save everything still queued (or spilled), then stop the writer. """
+
+        if self._writer is None:
+            return
+        # Ask the writer to finish. It notices within 'flush_interval' seconds, saves
+        # the remaining events and exits. (Cancelling it could interrupt a batch mid-write.)
+        self._stopping = True
+        await self._writer
+        self._writer = None
+
+    # --- PRODUCER SIDE ---
+    async def log(self, action: str, details: str, actor: str | None = None):
+        """ Queue one event. Returns as soon as the event is queued (or handled by the overflow policy). """
+
+        if self._writer is None or self._writer.done():
+            self.start()
+
+        # The time is taken NOW, so batching does not delay the recorded moment
+        event = {
+            "created_at": datetime.now(timezone.utc),
+            "action": action,
+            "actor": actor,
+            "details": details,
+        }
+
+        if self._queue.full():
+            if self.overflow_policy == "drop_oldest":
+                # Make room by throwing away the event that has waited the longest
+                self._queue.get_nowait()
+                AUDIT_DROPPED.inc(reason="overflow")
+            elif self.overflow_policy == "spill":
+                # Keep the event on disk; the writer saves it once the queue has drained
+                await self._spill([event])
+                AUDIT_ENQUEUED.inc()
+                return
+
+        # "block" waits here for room; the other policies have just made room
+        await self._queue.put(event)
+        AUDIT_ENQUEUED.inc()
+        AUDIT_QUEUE_DEPTH.set(self._queue.qsize())
+
+    # --- WRITER SIDE ---
+    async def _run(self):
+        """ Collect events into batches and save them, until 'stop' is called. """
+
+        try:
+            # Events left on disk by a previous run (or a crash) are saved first
+            await self._replay_spill()
+            while not self._stopping:
+                batch = await self._next_batch()
+                if batch:
+                    await self._save(batch)
+                # The queue has drained: a good moment to catch up on spilled events
+                if self._queue.empty():
+                    await self._replay_spill()
+        finally:
+            # Shutdown: save whatever is still in memory (and on disk) before exiting
+            remaining = self._drain()
+            for start in range(0, len(remaining), self.batch_size):
+                await self._save(remaining[start:start + self.batch_size])
+            await self._replay_spill()
+
+    async def _next_batch(self) -> list[dict]:
+        """ Wait for events and return up to 'batch_size' of them, after at most 'flush_interval' seconds. """
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        batch = []
+        while len(batch) < self.batch_size:
+            # Take everything that is already waiting without sleeping
+            batch.extend(self._drain(limit=self.batch_size - len(batch)))
+            if len(batch) >= self.batch_size:
+                break
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        AUDIT_QUEUE_DEPTH.set(self._queue.qsize())
+        return batch
+
+    def _drain(self, limit: int | None = None) -> list[dict]:
+        """ Take up to 'limit' queued events (all of them when None) without waiting. """
+
+        events = []
+        while not self._queue.empty() and (limit is None or len(events) < limit):
+            events.append(self._queue.get_nowait())
+        return events
+
+    async def _save(self, batch: list[dict], spill_on_error: bool = True) -> bool:
+        """
+        Save one batch with a single multi-row INSERT. Returns False if it failed; the events
+        are then spilled or dropped (or left to the caller, with 'spill_on_error=False').
+        """
+
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        try:
+            # A list of parameter sets is sent as INSERT ... VALUES (..), (..), ...
+            async with engine.begin() as conn:
+                await conn.execute(insert(AuditEvent), batch)
+        except Exception as exc:
+            logger.error("Could not save audit events", extra={"events": len(batch), "error": str(exc)})
+            if not spill_on_error:
+                return False
+            # The database is unavailable: keep the events on disk if we may, otherwise they are lost
+            if self.overflow_policy == "spill":
+                await self._spill(batch)
+            else:
+                AUDIT_DROPPED.inc(len(batch), reason="write_error")
+            return False
+        AUDIT_WRITTEN.inc(len(batch))
+        AUDIT_FLUSH_SECONDS.observe(loop.time() - started_at)
+        return True
+
+    # --- SPILL FILE ---
+    # File access runs in a worker thread ('asyncio.to_thread'): a slow disk must not
+    # stall the event loop, and with the "spill" policy 'log' runs inside requests.
+    async def _spill(self, events: list[dict]):
+        """ Append events to the spill file, one JSON object per line. """
+
+        lines = "".join(
+            json.dumps({**event, "created_at": event["created_at"].isoformat()}) + "\n"
+            for event in events
+        )
+        async with self._spill_lock:
+            await asyncio.to_thread(_append_text, self.spill_path, lines)
+        AUDIT_SPILLED.inc(len(events))
+
+    async def _replay_spill(self):
+        """ Save events from the spill file in batches, then remove the file. """
+
+        # Move the file aside first, so new spills go to a fresh file meanwhile.
+        # A '.replay' file that already exists was interrupted last time: finish it first.
+        # Lines that cannot be read (e.g. cut off by a crash) are moved to a '.bad' file.
+        replay_path = self.spill_path + ".replay"
+        bad_path = self.spill_path + ".bad"
+        async with self._spill_lock:
+            if not await asyncio.to_thread(_claim_spill_file, self.spill_path, replay_path):
+                return
+
+        offset = 0
+        while True:
+            batch, next_offset = await asyncio.to_thread(
+                _read_spill_batch, replay_path, offset, self.batch_size, bad_path
+            )
+            if not batch:
+                break
+            if not await self._save(batch, spill_on_error=False):
+                # Still no database: leave the file as it is (minus what was saved) and try
+                # again later, instead of copying every event into a new spill file each time
+                if offset:
+                    await asyncio.to_thread(_drop_head, replay_path, offset)
+                return
+            offset = next_offset
+        await asyncio.to_thread(os.remove, replay_path)
+
+
+# --- Spill file helpers (blocking; called through asyncio.to_thread) ---
+def _append_text(path: str, text: str):
+    with open(path, "a", encoding="utf-8") as spill_file:
+        spill_file.write(text)
+
+
+def _claim_spill_file(spill_path: str, replay_path: str) -> bool:
+    """ Make sure there is a '.replay' file to work through; False if there is nothing to replay. """
+
+    if os.path.exists(replay_path):
+        return True
+    if not os.path.exists(spill_path):
+        return False
+    os.replace(spill_path, replay_path)
+    return True
+
+
+def _read_spill_batch(path: str, offset: int, batch_size: int, bad_path: str) -> tuple[list[dict], int]:
+    """
+    Read up to 'batch_size' events starting at byte 'offset'; also returns the offset after them.
+    Lines that are not valid events are appended to 'bad_path' and skipped.
+    """
+
+    events = []
+    with open(path, "rb") as replay_file:
+        replay_file.seek(offset)
+        while len(events) < batch_size:
+            line = replay_file.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+                event["created_at"] = datetime.fromisoformat(event["created_at"])
+            except (ValueError, TypeError, KeyError) as exc:
+                logger.warning("Skipped unreadable audit spill line", extra={"path": bad_path, "error": str(exc)})
+                AUDIT_DROPPED.inc(reason="unreadable")
+                with open(bad_path, "ab") as bad_file:
+                    bad_file.write(line if line.endswith(b"\n") else line + b"\n")
+                continue
+            events.append(event)
+        return events, replay_file.tell()
+
+
+def _drop_head(path: str, offset: int):
+    """ Remove the first 'offset' bytes (the events already saved) from a file. """
+
+    with open(path, "rb") as replay_file:
+        replay_file.seek(offset)
+        rest = replay_file.read()
+    with open(path + ".tmp", "wb") as tmp_file:
+        tmp_file.write(rest)
+    os.replace(path + ".tmp", path)
+
+
+# The single audit pipeline of this process (started and flushed in the app lifespan).
+audit_pipeline = AuditPipeline(
+    maxsize=settings.audit_queue_size,
+    batch_size=settings.audit_batch_size,
+    flush_interval=settings.audit_flush_interval_seconds,
+    overflow_policy=settings.audit_overflow_policy,
+    spill_path=settings.audit_spill_path,
+)
+
 
 # This function creates a record of a specific event or change in the system
-def audit_log(action: str, details: str):
+async def audit_log(action: str, details: str, actor: str | None = None):
     """
     Records a system event.
     :param action: What happened (e.g., 'CREATE_USER', 'DELETE_USER')
-    :param details: Specific info (e.g., 'User ID 5 was deleted by Admin')
+    :param details: Specific info (e.g., 'User ID 5 was deleted')
+    :param actor: Who did it (a username), or None for anonymous requests
     """
-    
-    # 1. Simulates a 'blocking' or high-latency operation.
-    # In a real app, this might be writing to a slow file or calling an external security API.
-    # Because of this 1-second sleep, any code calling this will wait for 1 second.
-    time.sleep(1) 
-    
-    # 2. Output the log entry to the console.
-    # The '|' acts as a delimiter to make the logs easy to parse by other software.
-    print(f"[AUDIT] {action} | {details}")
\ No newline at end of file
+
+    # Only queues the event: the database write happens later, in a batch
+    await audit_pipeline.log(action, details, actor)
+
+
+# --- QUERY: One page of audit history, newest first (keyset pagination) ---
+async def get_audit_events(
+    db: AsyncSession,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+    actor: str | None = None,
+    action: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> dict:
+    # 1. Where the previous page stopped (raises ValueError on a bad cursor)
+    after = decode_time_cursor(cursor)
+
+    # 2. Newest first. 'id' breaks ties between events with the same timestamp.
+    query = (
+        select(AuditEvent)
+        .order_by(AuditEvent.created_at.desc(), AuditEvent.id.desc())
+        .limit(limit + 1)
+    )
+    if actor is not None:
+        query = query.where(AuditEvent.actor == actor)
+    if action is not None:
+        query = query.where(AuditEvent.action == action)
+
+    # 3. Time bounds let PostgreSQL skip every monthly partition outside the range
+    if since is not None:
+        query = query.where(AuditEvent.created_at >= since)
+    if until is not None:
+        query = query.where(AuditEvent.created_at < until)
+    if after is not None:
+        last_created_at, last_id = after
+        # The plain '<=' is implied by the row comparison, but only a simple bound
+        # on 'created_at' lets the planner prune partitions newer than the cursor
+        query = query.where(
+            AuditEvent.created_at <= last_created_at,
+            tuple_(AuditEvent.created_at, AuditEvent.id) < (last_created_at, last_id),
+        )
+
+    result = await db.execute(query)
+    events = result.scalars().all()
+
+    # 4. The extra row only tells us that another page exists
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = encode_time_cursor(events[-1].created_at, events[-1].id)
+
+    return {"items": events, "next_cursor": next_cursor}
@@ -2,17 +2,46 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # 'select' is the tool used to write database queries (like searching for users).
-from sqlalchemy import select
+# 'text' lets us run a small piece of hand-written SQL (used for the row estimate).
+# 'insert' builds INSERT statements (used for multi-row bulk inserts).
+# 'update' and 'delete' build single-statement writes that can use RETURNING.
+from sqlalchemy import select, text, insert, update, delete
+# PostgreSQL's own INSERT supports 'ON CONFLICT DO NOTHING' (used by register_user).
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+# 'selectinload' loads a relationship for MANY objects with one extra query (WHERE ... IN (...)),
+# instead of one lazy query per object (the "N+1" pattern).
+from sqlalchemy.orm import selectinload
+
+# 'open_read_session' opens a read-only session (on a replica if available) that lives
+# outside a single request; used by the export stream.
+from app.db.session import open_read_session, engine
 
 # 'User' is your Database Model (how data is stored in PostgreSQL).
 from app.models.user import User
+from app.models.address import Address
+
+# Helpers for cursor-based pagination (shared with the raw SQL service).
+from app.core.pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_id_cursor
+
+# The fields a client may select with '?fields=' (sparse fieldsets)
+from app.schemas.user_response import USER_FIELDS
+# Pages are handed out as Pydantic models, never as ORM objects (see _load_users_page)
+from app.schemas.user_response import UserResponse, UserWithAddressesResponse
 
 # 'UserCreate' and 'UserUpdate' are Pydantic Schemas (how data is validated from the user).
 from app.schemas.user_request import UserCreate, UserUpdate
 
-# 'hash_password' is the function that turns plain passwords into secure hashed versions.
-from app.core.security import hash_password, verify_password, create_access_token
+# The in-memory user cache. We use 'cache.user_cache' (not a direct import)
+# so that a different cache backend can be plugged in at startup.
+from app.core import cache
+from app.core.cache import MISSING
+from app.core.config import settings
+# Concurrent identical reads share one database call
+from app.core.singleflight import reads
 
+# 'hash_password_async' turns plain passwords into secure hashed versions.
+# The '_async' variants run in a dedicated thread pool, so bcrypt never blocks the event loop.
+from app.core.security import hash_password_async, hash_passwords_async, verify_password_async, create_access_token
 
 
 
@@ -21,83 +50,356 @@ from app.core.security import hash_password, verify_password, create_access_toke
 
 # --- CREATE: Add a new user to the database ---
 async def create_user(db: AsyncSession, user: UserCreate) -> User:
-    # 1. Turn the input data into a Database object
-    new_user = User(name=user.name, age=user.age)
-    db.add(new_user)            # Stage it
+    # 1. INSERT ... RETURNING gives us the new row (with its generated ID) in the
+    #    same statement, so no extra 'refresh' query is needed afterwards.
+    hashed_pw = await hash_password_async(user.password)
+    result = await db.execute(
+        insert(User)
+        .values(name=user.name, age=user.age, username=user.username, hashed_password=hashed_pw, role="user")
+        .returning(User)
+    )
+    new_user = result.scalar_one()
     await db.commit()           # Save it permanently
-    await db.refresh(new_user)  # Get the new ID from the DB
+
+    # 2. This ID may have been cached as "not found" before it existed
+    await cache.invalidate_user(new_user.id)
     return new_user
 
-# --- READ ALL: Get every user in the table ---
-async def get_all_users(db: AsyncSession):
-    # 1. Run a search for all users
-    result = await db.execute(select(User))
-    # 2. Convert database rows into a Python list
-    return result.scalars().all()
+# --- BULK CREATE: Add many users in a single transaction ---
+# Users whose username is already taken are skipped (they are not in the result).
+async def create_users_bulk(db: AsyncSession, users: list[UserCreate], chunk_size: int) -> list[dict]:
+    # 0. Hash every password first, in the hashing pool (never on the event loop)
+    hashed_passwords = await hash_passwords_async([u.password for u in users])
+
+    created = []
+    try:
+        # 1. Send 'chunk_size' users per statement: INSERT ... VALUES (..), (..), ... RETURNING
+        #    One round trip per chunk instead of three per user.
+        #    ON CONFLICT (username) DO NOTHING skips taken names instead of failing the batch.
+        for start in range(0, len(users), chunk_size):
+            chunk = users[start:start + chunk_size]
+            result = await db.execute(
+                pg_insert(User)
+                .values([
+                    {"name": u.name, "age": u.age, "username": u.username,
+                     "hashed_password": hashed_pw, "role": "user"}
+                    for u, hashed_pw in zip(chunk, hashed_passwords[start:start + chunk_size])
+                ])
+                .on_conflict_do_nothing(index_elements=[User.username])
+                .returning(User.id, User.name, User.age, User.version, User.username)
+            )
+            created.extend(dict(row) for row in result.mappings())
+
+        # 2. Commit once: either every chunk is saved, or none of them is
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    # 3. Forget any "not found" entries cached for the new IDs
+    for row in created:
+        await cache.invalidate_user(row["id"])
+    return created
+
+# --- READ ALL: Get one page of users (keyset pagination) ---
+async def get_all_users(
+    db: AsyncSession,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+    include_total: bool = False,
+    as_rows: bool = False,
+    fields: tuple[str, ...] | None = None,
+    include_addresses: bool = False,
+) -> dict:
+    # 1. Work out where the previous page stopped (raises ValueError on a bad cursor)
+    last_id = decode_id_cursor(cursor)
+
+    # 2. Requests for the same page at the same moment share one query. Replica and
+    #    primary reads are kept apart, so a client that just wrote still sees its write.
+    source = "primary" if db.bind is engine else "replica"
+    # 3. Addresses wanted ('?include=addresses'): users with their addresses loaded
+    if include_addresses:
+        return await reads.do(
+            ("users.list", source, "addresses", last_id, limit, include_total),
+            _load_users_page, db, last_id, limit, include_total, True,
+        )
+
+    # 4. Only some fields wanted ('?fields='): select just those columns, as plain rows
+    if fields is not None:
+        return await reads.do(
+            ("users.list", source, fields, last_id, limit, include_total),
+            _load_users_rows, db, last_id, limit, include_total, fields,
+        )
+    load = _load_users_rows if as_rows else _load_users_page
+    return await reads.do(
+        ("users.list", source, as_rows, last_id, limit, include_total),
+        load, db, last_id, limit, include_total,
+    )
+
+
+async def _load_users_page(
+    db: AsyncSession,
+    last_id: int | None,
+    limit: int,
+    include_total: bool,
+    with_addresses: bool = False,
+) -> dict:
+    # 1. Ask for one row MORE than the page size, so we know if another page exists
+    query = select(User).order_by(User.id).limit(limit + 1)
+    if last_id is not None:
+        query = query.where(User.id > last_id)
+    if with_addresses:
+        # ONE more query loads the addresses of every user on the page
+        query = query.options(selectinload(User.addresses))
+
+    result = await db.execute(query)
+    users = result.scalars().all()
+
+    # 2. If we got the extra row, drop it and hand out a cursor pointing at the last kept row
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor({"id": users[-1].id})
+
+    # 3. The page may be shared with concurrent requests (single-flight), so it must not
+    #    hold ORM objects: they belong to this request's session (lazy loads, expiry, ...)
+    model = UserWithAddressesResponse if with_addresses else UserResponse
+    items = [model.model_validate(user, from_attributes=True) for user in users]
+
+    return {
+        "items": items,
+        "next_cursor": next_cursor,
+        "estimated_total": await estimate_user_count(db) if include_total else None,
+    }
+
 
-# --- READ BY ID: Find one specific user ---
-async def get_user_by_id(db: AsyncSession, user_id: int):
-    # 1. Search for the user where the ID matches
+# --- READ ALL (fast path): The same page as plain dicts, ready to be encoded ---
+# Building a 'User' object per row (identity map, change tracking, ...) and then
+# validating it again into a 'UserResponse' costs far more than the query itself on
+# big pages. Selecting only the public columns returns plain tuples instead, which
+# are turned into dicts directly. See benchmarks/bench_fast_read_path.py.
+# With '?fields=' only the requested columns are selected at all.
+async def _load_users_rows(
+    db: AsyncSession,
+    last_id: int | None,
+    limit: int,
+    include_total: bool,
+    fields: tuple[str, ...] = USER_FIELDS,
+) -> dict:
+    # 1. Same query as _load_users_page, but for columns instead of whole entities.
+    #    'id' always comes first: the cursor needs it, even if the client did not ask for it.
+    other_fields = tuple(name for name in fields if name != "id")
+    query = (
+        select(User.id, *(getattr(User, name) for name in other_fields))
+        .order_by(User.id)
+        .limit(limit + 1)
+    )
+    if last_id is not None:
+        query = query.where(User.id > last_id)
+
+    result = await db.execute(query)
+    rows = result.all()
+
+    # 2. Extra row -> there is a next page
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor({"id": rows[-1][0]})
+
+    # 3. Plain dicts with exactly the requested fields
+    if "id" in fields:
+        items = [dict(zip(fields, row)) for row in rows]
+    else:
+        items = [dict(zip(other_fields, row[1:])) for row in rows]
+
+    return {
+        "items": items,
+        "next_cursor": next_cursor,
+        "estimated_total": await estimate_user_count(db) if include_total else None,
+    }
+
+
+# --- ESTIMATED COUNT: Approximate table size without scanning it ---
+async def estimate_user_count(db: AsyncSession) -> int | None:
+    # 'reltuples' is the row count Postgres keeps for the query planner (updated by ANALYZE/VACUUM).
+    # Reading it is instant, while COUNT(*) has to visit every row.
     result = await db.execute(
-        select(User).where(User.id == user_id)
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'users'::regclass")
     )
-    # 2. Return the user, or None if not found
-    return result.scalar_one_or_none()
+    estimate = result.scalar_one_or_none()
 
-# --- UPDATE: Change an existing user's info ---
-async def update_user(db: AsyncSession, user_id: int, user: UserUpdate):
-    # 1. Find the user first
-    existing_user = await get_user_by_id(db, user_id)
-    if not existing_user:
+    # -1 means the table has never been analyzed, so we have no estimate yet
+    if estimate is None or estimate < 0:
         return None
+    return int(estimate)
+
+# --- EXPORT: Stream every user without loading the table into memory ---
+async def stream_users(batch_size: int):
+    # 1. Open a dedicated session. A StreamingResponse keeps sending data AFTER the
+    #    route function has returned, when the request's own 'get_db' session may be gone.
+    #    A full-table export is exactly the kind of read a replica should take.
+    async with await open_read_session() as session:
+        # 2. 'stream' uses a server-side cursor: PostgreSQL sends 'batch_size' rows
+        #    at a time ('yield_per') instead of the whole result set at once.
+        #    Selecting plain columns skips building a full ORM object per row.
+        result = await session.stream(
+            select(User.id, User.name, User.age)
+            .order_by(User.id)
+            .execution_options(yield_per=batch_size)
+        )
+
+        # 3. Hand rows out one batch at a time, as lists of plain dicts
+        async for batch in result.mappings().partitions():
+            yield [dict(row) for row in batch]
+
+# --- READ BY ID: Find one specific user (read-through cache) ---
+# 'fields' (from '?fields=') limits the answer to those fields; None = all of them.
+async def get_user_by_id(db: AsyncSession, user_id: int, fields: tuple[str, ...] | None = None) -> dict | None:
+    # 1. Answer from memory if we can (this may also be a cached "not found")
+    cached = await cache.user_cache.get(user_id)
+    if cached is not MISSING:
+        if cached is None or fields is None:
+            return cached
+        return {name: cached[name] for name in fields}
+
+    # 2. Cache miss with only some fields wanted: select just those columns.
+    #    (Not cached: the cache only holds complete users.)
+    #    Replica and primary reads are kept apart, as for the list.
+    source = "primary" if db.bind is engine else "replica"
+    if fields is not None:
+        return await reads.do(("users.get_user", user_id, source, fields), _load_user_fields, db, user_id, fields)
+
+    # 3. Cache miss: load it, sharing the query with concurrent requests for the same user
+    return await reads.do(("users.get_user", user_id, source, None), _load_user, db, user_id)
+
+
+async def _load_user_fields(db: AsyncSession, user_id: int, fields: tuple[str, ...]) -> dict | None:
+    result = await db.execute(
+        select(*(getattr(User, name) for name in fields)).where(User.id == user_id)
+    )
+    row = result.mappings().one_or_none()
+    return dict(row) if row else None
+
+
+async def _load_user(db: AsyncSession, user_id: int) -> dict | None:
+    # 1. Search for the user where the ID matches.
+    #    Only the public columns are selected, so no full ORM object is built.
+    result = await db.execute(
+        select(User.id, User.name, User.age, User.version).where(User.id == user_id)
+    )
+    row = result.mappings().one_or_none()
+    user = dict(row) if row else None
+
+    # 2. Remember the answer. "Not found" is kept for a shorter time.
+    #    Only answers from the primary: a lagging replica may still return the user as it
+    #    was BEFORE the last write, and the cache would then serve that to everyone.
+    if db.bind is engine:
+        ttl = None if user else settings.user_cache_negative_ttl_seconds
+        await cache.user_cache.set(user_id, user, ttl=ttl)
+
+    # 3. Return the user, or None if not found
+    return user
 
-    # 2. Apply the new name and age
-    existing_user.name = user.name
-    existing_user.age = user.age
+# --- ADDRESSES: The addresses of one user ('GET /users/{id}?include=addresses') ---
+async def get_user_addresses(db: AsyncSession, user_id: int) -> list[dict]:
+    # Uses the index on 'addresses.user_id'
+    result = await db.execute(
+        select(Address.id, Address.email).where(Address.user_id == user_id).order_by(Address.id)
+    )
+    return [dict(row) for row in result.mappings()]
 
-    await db.commit()           # Save changes
-    await db.refresh(existing_user)
-    return existing_user
+# --- UPDATE: Change an existing user's info ---
+# 'versions' (from an 'If-Match' header) makes the update conditional: it only happens
+# if the user is still at one of these versions. None = whatever the current version is.
+# Returns the user's new state, or None if there is no such user (at those versions).
+async def update_user(
+    db: AsyncSession, user_id: int, user: UserUpdate, versions: list[int] | None = None
+) -> UserResponse | None:
+    # 1. Only change the fields the client actually sent (partial update)
+    values = user.model_dump(exclude_none=True)
+    if not values:
+        # Nothing to change: just return the current state (if it is the expected one)
+        current = await get_user_by_id(db, user_id)
+        if current is None or (versions is not None and current["version"] not in versions):
+            return None
+        return UserResponse(**current)
+
+    # 2. UPDATE ... WHERE id = ... RETURNING does the lookup, the change and the
+    #    read-back in ONE statement, instead of SELECT + UPDATE + SELECT (refresh).
+    #    Checking the version in the same WHERE clause makes "compare and write" atomic.
+    query = (
+        update(User)
+        .where(User.id == user_id)
+        .values(**values, version=User.version + 1)
+        .returning(User.id, User.name, User.age, User.version)
+        .execution_options(synchronize_session=False)
+    )
+    if versions is not None:
+        query = query.where(User.version.in_(versions))
+    result = await db.execute(query)
+    row = result.mappings().one_or_none()
+
+    # 3. No row came back means there was no user with that ID (or not at that version)
+    await db.commit()
+
+    # 4. The cached copy is now stale
+    await cache.invalidate_user(user_id)
+    return UserResponse(**row) if row else None
 
 # --- DELETE: Permanently remove a user ---
-async def delete_user(db: AsyncSession, user_id: int) -> bool:
-    # 1. Find the user first
-    user = await get_user_by_id(db, user_id)
-    if not user:
-        return False # Nothing to delete
+# 'versions' works as in update_user: only delete the user if it is still at one of them.
+async def delete_user(db: AsyncSession, user_id: int, versions: list[int] | None = None) -> bool:
+    # 1. DELETE ... RETURNING id tells us in the same statement whether the row existed
+    query = (
+        delete(User)
+        .where(User.id == user_id)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+    if versions is not None:
+        query = query.where(User.version.in_(versions))
+    result = await db.execute(query)
+    deleted_id = result.scalar_one_or_none()
 
-    # 2. Remove from session and save change
-    await db.delete(user)
+    # 2. Save the change (a no-op transaction if nothing matched)
     await db.commit()
-    return True
+
+    # 3. Make sure nobody is served the deleted user from the cache
+    await cache.invalidate_user(user_id)
+    return deleted_id is not None
 
 
 async def register_user(db: AsyncSession, user_data):
-    # check if username already exists
-    result = await db.execute(select(User).where(User.username == user_data.username))
-    existing_user = result.scalar_one_or_none()
+    # 1. Hash the password (in the hashing pool, not on the event loop)
+    hashed_pw = await hash_password_async(user_data.password)
 
-    if existing_user:
-        raise ValueError("Username already exists")
-    
-    # 2. Hash the password
-    hashed_pw = hash_password(user_data.password)
-
-
-    # 3. Create new User ORM object
-    new_user = User(
-        username=user_data.username,
-        hashed_password=hashed_pw,
-        role="user",
-        name=user_data.name,
-        age=user_data.age
+    # 2. INSERT ... ON CONFLICT (username) DO NOTHING RETURNING *
+    #    The unique index on 'username' decides if the name is taken, in the same
+    #    statement as the insert. A separate "does it exist?" SELECT costs an extra
+    #    round trip and is racy: two requests could both see "free" and both insert.
+    result = await db.execute(
+        pg_insert(User)
+        .values(
+            username=user_data.username,
+            hashed_password=hashed_pw,
+            role="user",
+            name=user_data.name,
+            age=user_data.age
+        )
+        .on_conflict_do_nothing(index_elements=[User.username])
+        .returning(User)
     )
+    new_user = result.scalar_one_or_none()
+
+    # 3. No row returned means the username already existed
+    if new_user is None:
+        await db.rollback()
+        raise ValueError("Username already exists")
 
-    # 4. Add to the database
-    db.add(new_user)
     await db.commit()
-    await db.refresh(new_user)
 
+    # 4. This ID may have been cached as "not found" before it existed
+    await cache.invalidate_user(new_user.id)
     return new_user
 
 
@@ -116,7 +418,7 @@ async def authenticate_user(db, username: str, password: str):
         return None
  
     # 3. Verify the password
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return None
 
     return user
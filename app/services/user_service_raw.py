@@ -1,6 +1,86 @@
-from app.db.database import db_pool
+import asyncpg
+# 'get_pool' hands out the shared asyncpg connection pool.
+from app.db.database import get_pool
 from app.schemas.user_request import UserCreate, UserUpdate
-from app.schemas.user_response import UserResponse
+from app.schemas.user_response import UserResponse, UserWithAddressesResponse
+from app.schemas.address_response import AddressResponse
+from app.core.pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_id_cursor
+# Writes here must also clear the caches used by the ORM service
+from app.core import cache
+# Time left before the request's deadline (None = no deadline); asyncpg cancels the
+# query on the server when its 'timeout' runs out
+from app.core.deadlines import remaining
+# Passwords are hashed in a dedicated thread pool, never on the event loop
+from app.core.security import hash_password_async, hash_passwords_async
+# Concurrent identical reads share one query
+from app.core.singleflight import reads
+
+# Every query is a fixed SQL string with $1, $2 placeholders. asyncpg prepares each
+# distinct string once per connection and reuses the prepared statement afterwards.
+INSERT_USER_SQL = """
+    INSERT INTO users (name, age, username, hashed_password, role)
+    VALUES ($1, $2, $3, $4, 'user')
+    RETURNING id, name, age, version
+"""
+# 'unnest' turns the arrays into rows, so a whole chunk is ONE statement with ONE plan,
+# whatever the chunk size. Taken usernames are skipped (ON CONFLICT DO NOTHING).
+INSERT_USERS_SQL = """
+    INSERT INTO users (name, age, username, hashed_password, role)
+    SELECT name, age, username, hashed_password, 'user'
+    FROM unnest($1::text[], $2::int[], $3::text[], $4::text[]) AS t(name, age, username, hashed_password)
+    ON CONFLICT (username) DO NOTHING
+    RETURNING id, name, age, version, username
+"""
+FIRST_PAGE_SQL = "SELECT id, name, age, version FROM users ORDER BY id LIMIT $1"
+NEXT_PAGE_SQL = "SELECT id, name, age, version FROM users WHERE id > $1 ORDER BY id LIMIT $2"
+ESTIMATE_USERS_SQL = "SELECT reltuples::bigint FROM pg_class WHERE oid = 'users'::regclass"
+EXPORT_USERS_SQL = "SELECT id, name, age FROM users ORDER BY id"
+GET_USER_SQL = "SELECT id, name, age, version FROM users WHERE id = $1"
+# COALESCE keeps the current value when a field was not sent (partial update).
+# $4 is the list of versions the client expects ('If-Match'); NULL = any version.
+UPDATE_USER_SQL = """
+    UPDATE users
+    SET name = COALESCE($1, name),
+        age = COALESCE($2, age),
+        version = version + 1
+    WHERE id = $3
+      AND ($4::int[] IS NULL OR version = ANY($4))
+    RETURNING id, name, age, version
+"""
+# $2: the versions the client expects, as in UPDATE_USER_SQL
+DELETE_USER_SQL = "DELETE FROM users WHERE id = $1 AND ($2::int[] IS NULL OR version = ANY($2)) RETURNING id"
+
+# The addresses of MANY users in one query (instead of one query per user)
+ADDRESSES_FOR_USERS_SQL = """
+    SELECT user_id, id, email
+    FROM addresses
+    WHERE user_id = ANY($1::int[])
+    ORDER BY user_id, id
+"""
+
+
+# Sparse fieldsets ('?fields='): the column list is built from the requested fields.
+# Names only ever come from USER_FIELDS (checked by parse_user_fields), never from raw
+# client input, and there are few combinations, so asyncpg still reuses prepared statements.
+def page_sql(fields: tuple[str, ...], after_id: bool) -> str:
+    # 'id' always comes first: the cursor needs it, even if the client did not ask for it
+    columns = ", ".join(("id", *(name for name in fields if name != "id")))
+    if after_id:
+        return f"SELECT {columns} FROM users WHERE id > $1 ORDER BY id LIMIT $2"
+    return f"SELECT {columns} FROM users ORDER BY id LIMIT $1"
+
+
+def user_sql(fields: tuple[str, ...]) -> str:
+    return f"SELECT {', '.join(fields)} FROM users WHERE id = $1"
+
+
+async def _addresses_by_user(conn, user_ids: list[int]) -> dict[int, list[AddressResponse]]:
+    """ The addresses of all 'user_ids', grouped by user (users without any are missing). """
+
+    grouped = {}
+    for r in await conn.fetch(ADDRESSES_FOR_USERS_SQL, user_ids, timeout=remaining()):
+        grouped.setdefault(r["user_id"], []).append(AddressResponse(id=r["id"], email=r["email"]))
+    return grouped
 
 # users_db = []
 # user_id_counter = 1
@@ -21,39 +101,54 @@ from app.schemas.user_response import UserResponse
 
 
 # --- CREATE USER ---
-def create_user(user: UserCreate) -> UserResponse:
+async def create_user(user: UserCreate) -> UserResponse:
     """Inserts a new user into the database and returns the created record."""
-    # 1. Borrow a connection from the pool
-    conn = db_pool.getconn()
-    try:
-        # 2. Open a cursor (used to execute SQL commands)
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO users (name, age)
-                VALUES (%s, %s)
-                RETURNING id;
-                """,
-                (user.name, user.age) # 3. Parameterized query to prevent SQL injection
+    # 1. Hash the password in the hashing pool, before holding a connection
+    hashed_pw = await hash_password_async(user.password)
+
+    # 2. Borrow a connection from the pool (given back automatically by 'async with')
+    pool = await get_pool()
+    async with pool.acquire(timeout=remaining()) as conn:
+        # Parameterized query to prevent SQL injection; RETURNING gives us the new ID.
+        # A single statement runs in its own transaction, so no explicit commit is needed.
+        try:
+            row = await conn.fetchrow(
+                INSERT_USER_SQL, user.name, user.age, user.username, hashed_pw, timeout=remaining()
             )
-            # 4. Grab the ID generated by the database
-            user_id = cur.fetchone()[0]
-            # 5. Save the changes permanently
-            conn.commit()
-
-            # 6. Return data formatted as the response schema
-            return UserResponse(
-                id=user_id,
-                name=user.name,
-                age=user.age
-            )
-    except Exception:
-        # 7. If something crashes, undo any partial changes
-        conn.rollback()
-        raise
-    finally:
-        # 8. Crucial: Give the connection back to the pool for others to use
-        db_pool.putconn(conn)
+        except asyncpg.UniqueViolationError:
+            raise ValueError("Username already exists")
+
+    # 3. This ID may have been cached as "not found" by the ORM service
+    await cache.invalidate_user(row["id"])
+
+    # 4. Return data formatted as the response schema
+    return UserResponse(id=row["id"], name=row["name"], age=row["age"], version=row["version"])
+
+
+# --- BULK CREATE USERS ---
+async def create_users_bulk(users: list[UserCreate], chunk_size: int) -> list[dict]:
+    """Inserts many users in one transaction, one multi-row INSERT per chunk; skips taken usernames."""
+    # Every password is hashed first, in the hashing pool
+    hashed_passwords = await hash_passwords_async([u.password for u in users])
+    rows = []
+    pool = await get_pool()
+    async with pool.acquire(timeout=remaining()) as conn:
+        # If any chunk fails, the transaction rolls back every chunk
+        async with conn.transaction():
+            for start in range(0, len(users), chunk_size):
+                chunk = users[start:start + chunk_size]
+                rows.extend(await conn.fetch(
+                    INSERT_USERS_SQL,
+                    [u.name for u in chunk],
+                    [u.age for u in chunk],
+                    [u.username for u in chunk],
+                    hashed_passwords[start:start + chunk_size],
+                    timeout=remaining(),
+                ))
+
+    for r in rows:
+        await cache.invalidate_user(r["id"])
+    return [dict(r) for r in rows]
 
 
 # def get_all_users():
@@ -63,22 +158,104 @@ def create_user(user: UserCreate) -> UserResponse:
 
 
 
-# --- GET ALL USERS ---
-def get_all_users():
-    """Fetches all user records from the users table."""
-    conn = db_pool.getconn()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, name, age FROM users;")
-            rows = cur.fetchall() # Retrieve all records as a list of tuples
-
-            # Transform raw database tuples into Pydantic objects
-            return [
-                UserResponse(id=r[0], name=r[1], age=r[2])
+# --- GET ALL USERS (one page at a time) ---
+async def get_all_users(
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+    include_total: bool = False,
+    fields: tuple[str, ...] | None = None,
+    include_addresses: bool = False,
+) -> dict:
+    """Fetches one page of users ordered by id, using keyset pagination ('fields' = only those columns)."""
+    # Raises ValueError on a bad cursor, before we even borrow a connection
+    last_id = decode_id_cursor(cursor)
+    # Requests for the same page at the same moment share one query
+    return await reads.do(
+        ("users_raw.list", fields, include_addresses, last_id, limit, include_total),
+        _load_users_page, last_id, limit, include_total, fields, include_addresses,
+    )
+
+
+async def _load_users_page(
+    last_id: int | None,
+    limit: int,
+    include_total: bool,
+    fields: tuple[str, ...] | None,
+    include_addresses: bool = False,
+) -> dict:
+    if fields is None:
+        first_page_sql, next_page_sql = FIRST_PAGE_SQL, NEXT_PAGE_SQL
+    else:
+        first_page_sql, next_page_sql = page_sql(fields, after_id=False), page_sql(fields, after_id=True)
+
+    pool = await get_pool()
+    async with pool.acquire(timeout=remaining()) as conn:
+        # 'id > last_id' walks the primary key index, so every page costs the same.
+        # We fetch limit + 1 rows to find out whether another page exists.
+        if last_id is None:
+            rows = await conn.fetch(first_page_sql, limit + 1, timeout=remaining())
+        else:
+            rows = await conn.fetch(next_page_sql, last_id, limit + 1, timeout=remaining())
+
+        estimated_total = None
+        if include_total:
+            # Planner statistics instead of COUNT(*); -1 means "never analyzed"
+            estimate = await conn.fetchval(ESTIMATE_USERS_SQL, timeout=remaining())
+            if estimate is not None and estimate >= 0:
+                estimated_total = int(estimate)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor({"id": rows[-1]["id"]})
+
+        # The addresses of every user on the page: ONE more query, on the same connection
+        addresses = {}
+        if include_addresses and rows:
+            addresses = await _addresses_by_user(conn, [r["id"] for r in rows])
+
+    # Only some fields wanted: plain dicts with exactly those fields
+    if fields is not None:
+        return {
+            "items": [{name: r[name] for name in fields} for r in rows],
+            "next_cursor": next_cursor,
+            "estimated_total": estimated_total,
+        }
+
+    if include_addresses:
+        return {
+            "items": [
+                UserWithAddressesResponse(
+                    id=r["id"], name=r["name"], age=r["age"], version=r["version"],
+                    addresses=addresses.get(r["id"], []),
+                )
                 for r in rows
-            ]
-    finally:
-        db_pool.putconn(conn)
+            ],
+            "next_cursor": next_cursor,
+            "estimated_total": estimated_total,
+        }
+
+    # Transform raw database records into Pydantic objects
+    return {
+        "items": [UserResponse(id=r["id"], name=r["name"], age=r["age"], version=r["version"]) for r in rows],
+        "next_cursor": next_cursor,
+        "estimated_total": estimated_total,
+    }
+
+
+# --- EXPORT ALL USERS (streaming) ---
+async def stream_users(batch_size: int):
+    """Yields every user as a dict, in lists of 'batch_size' (one round trip each)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        # A server-side cursor (which needs a transaction) lets PostgreSQL keep the
+        # result set while we pull 'batch_size' rows at a time.
+        # Leaving the 'async with' blocks early (client disconnected) ends the
+        # transaction and returns the connection to the pool.
+        async with conn.transaction(readonly=True):
+            cursor = await conn.cursor(EXPORT_USERS_SQL)
+            while rows := await cursor.fetch(batch_size):
+                yield [{"id": r["id"], "name": r["name"], "age": r["age"]} for r in rows]
 
 
 
@@ -94,27 +271,25 @@ def get_all_users():
 
 
 """Retrieves a single user by their primary key."""
-def get_user_by_id(user_id: int):
-    """Retrieves a single user by their primary key."""
-    conn = db_pool.getconn()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, name, age FROM users WHERE id = %s;",
-                (user_id,)
-            )
-            row = cur.fetchone()
-            # If no user found, return None (useful for 404 logic in routes)
-            if not row:
-                return None
-
-            return UserResponse(
-                id=row[0],
-                name=row[1],
-                age=row[2]
-            )
-    finally:
-        db_pool.putconn(conn)
+async def get_user_by_id(user_id: int, fields: tuple[str, ...] | None = None):
+    """Retrieves a single user by their primary key ('fields' = only those columns, as a dict)."""
+    # Concurrent requests for the same user share one query
+    return await reads.do(("users_raw.get_user", user_id, fields), _load_user, user_id, fields)
+
+
+async def _load_user(user_id: int, fields: tuple[str, ...] | None):
+    pool = await get_pool()
+    async with pool.acquire(timeout=remaining()) as conn:
+        sql = GET_USER_SQL if fields is None else user_sql(fields)
+        row = await conn.fetchrow(sql, user_id, timeout=remaining())
+
+    # If no user found, return None (useful for 404 logic in routes)
+    if not row:
+        return None
+    if fields is not None:
+        return dict(row)
+
+    return UserResponse(id=row["id"], name=row["name"], age=row["age"], version=row["version"])
 
 
 
@@ -133,37 +308,35 @@ def get_user_by_id(user_id: int):
 
 
 
+async def get_user_addresses(user_id: int) -> list[AddressResponse]:
+    """Retrieves the addresses of one user (uses the index on addresses.user_id)."""
+    pool = await get_pool()
+    async with pool.acquire(timeout=remaining()) as conn:
+        return (await _addresses_by_user(conn, [user_id])).get(user_id, [])
+
+
 # --- UPDATE USER ---
-def update_user(user_id: int, updated_data: UserUpdate):
-    """Updates an existing user's data and returns the new state."""
-    conn = db_pool.getconn()
-    try:
-        with conn.cursor() as cur:
-            # Note: This query updates ALL fields. 
-            # If updated_data has 'None' values, it might overwrite existing data with Null 
-            # unless the database handles it or your schema ensures values are present.
-            cur.execute(
-                """
-                UPDATE users
-                SET name = %s,
-                    age = %s
-                WHERE id = %s
-                RETURNING id, name, age;
-                """,
-                (updated_data.name, updated_data.age, user_id)
-            )
+async def update_user(user_id: int, updated_data: UserUpdate, versions: list[int] | None = None):
+    """Updates an existing user's data and returns the new state (None if not found or not at 'versions')."""
+    if updated_data.name is None and updated_data.age is None:
+        # Nothing to change: return the current state (if it is the expected one), no new version
+        current = await get_user_by_id(user_id)
+        if current is None or (versions is not None and current.version not in versions):
+            return None
+        return current
+
+    pool = await get_pool()
+    async with pool.acquire(timeout=remaining()) as conn:
+        # Fields left as None keep their current value (see UPDATE_USER_SQL)
+        row = await conn.fetchrow(
+            UPDATE_USER_SQL, updated_data.name, updated_data.age, user_id, versions, timeout=remaining()
+        )
 
-            row = cur.fetchone()
-            if not row:
-                return None # No user found with that ID
+    if not row:
+        return None # No user found with that ID (or it was changed in the meantime)
 
-            conn.commit()
-            return UserResponse(id=row[0], name=row[1], age=row[2])
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        db_pool.putconn(conn)
+    await cache.invalidate_user(user_id)
+    return UserResponse(id=row["id"], name=row["name"], age=row["age"], version=row["version"])
 
 
 
@@ -181,25 +354,15 @@ def update_user(user_id: int, updated_data: UserUpdate):
 
 
 # --- DELETE USER ---
-def delete_user(user_id: int) -> bool:
-    """Removes a user from the database. Returns True if successful, False if not found."""
-    conn = db_pool.getconn()
-    try:
-        with conn.cursor() as cur:
-            # We use RETURNING id to check if the row actually existed
-            cur.execute(
-                "DELETE FROM users WHERE id = %s RETURNING id;",
-                (user_id,)
-            )
-
-            deleted = cur.fetchone()
-            if not deleted:
-                return False
-
-            conn.commit()
-            return True
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        db_pool.putconn(conn)
\ No newline at end of file
+async def delete_user(user_id: int, versions: list[int] | None = None) -> bool:
+    """Removes a user from the database. Returns True if successful, False if not found (or not at 'versions')."""
+    pool = await get_pool()
+    async with pool.acquire(timeout=remaining()) as conn:
+        # We use RETURNING id to check if the row actually existed
+        deleted = await conn.fetchval(DELETE_USER_SQL, user_id, versions, timeout=remaining())
+
+    if deleted is None:
+        return False
+
+    await cache.invalidate_user(user_id)
+    return True
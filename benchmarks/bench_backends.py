@@ -0,0 +1,205 @@
+# Side-by-side benchmark of the two user back ends:
+#   /orm/users/...  -> app.routers.users      (SQLAlchemy ORM, app.services.user_service)
+#   /raw/users/...  -> app.routers.users_raw  (asyncpg,        app.services.user_service_raw)
+#
+# Requests are driven in-process through httpx's ASGI transport (no network, no server),
+# so the numbers reflect the application and database work only.
+#
+# Against PostgreSQL (uses the app's normal .env / environment variables):
+#   python -m benchmarks.bench_backends --requests 5000 --concurrency 32
+#
+# Against a temporary SQLite stand-in (no database server needed; ORM back end only,
+# because the raw back end speaks the PostgreSQL protocol via asyncpg):
+#   python -m benchmarks.bench_backends --database sqlite
+#
+# The payload mix is a comma-separated list of operation=weight, e.g.
+#   --mix get=70,list=20,update=10
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+
+OPERATIONS = ("get", "list", "update")
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name}', choose from {OPERATIONS}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """ Nearest-rank percentile of an already sorted list. """
+
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def build_request(operation: str, prefix: str, user_ids: list, rng: random.Random):
+    """ Return (method, url, json_body) for one operation. """
+
+    if operation == "get":
+        return "GET", f"{prefix}/users/{rng.choice(user_ids)}", None
+    if operation == "list":
+        return "GET", f"{prefix}/users/?limit=50", None
+    return "PUT", f"{prefix}/users/{rng.choice(user_ids)}", {"age": rng.randint(1, 90)}
+
+
+async def run_backend(client, prefix: str, args, user_ids: list) -> dict:
+    """ Fire args.requests requests at one back end with args.concurrency workers. """
+
+    rng = random.Random(args.seed)
+    operations = rng.choices(list(args.mix), weights=list(args.mix.values()), k=args.requests)
+    timings = {op: [] for op in args.mix}
+    errors = {op: 0 for op in args.mix}
+    queue = iter(operations)
+
+    async def worker():
+        for operation in queue:
+            method, url, body = build_request(operation, prefix, user_ids, rng)
+            started_at = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            timings[operation].append(time.perf_counter() - started_at)
+            if response.status_code >= 400:
+                errors[operation] += 1
+
+    # Warm-up: open pool connections and prepare statements before measuring
+    for operation in args.mix:
+        method, url, body = build_request(operation, prefix, user_ids, rng)
+        await client.request(method, url, json=body)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    return {"elapsed": elapsed, "timings": timings, "errors": errors}
+
+
+def print_report(backend: str, result: dict):
+    total = sum(len(t) for t in result["timings"].values())
+    print(f"\n{backend}: {total} requests in {result['elapsed']:.2f}s = {total / result['elapsed']:.0f} req/s")
+    print(f"  {'operation':<10}{'count':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for operation, values in result["timings"].items():
+        values.sort()
+        print(
+            f"  {operation:<10}{len(values):>8}{len(values) / result['elapsed']:>9.0f}"
+            f"{percentile(values, 0.50) * 1000:>9.2f}{percentile(values, 0.95) * 1000:>9.2f}"
+            f"{percentile(values, 0.99) * 1000:>9.2f}{result['errors'][operation]:>8}"
+        )
+
+
+async def main(args):
+    # Imported here, after the SQLite defaults below may have been set
+    import httpx
+    from fastapi import FastAPI
+    from sqlalchemy import delete, insert
+
+    from app.core import cache
+    from app.core.cache import LRUCache
+    from app.db.base import Base
+    from app.db.database import close_pool
+    from app.db.session import AsyncSessionLocal, engine, get_db, get_read_db
+    from app.models.address import Address
+    from app.models.user import User
+    from app.routers.users import router as orm_router
+    from app.routers.users_raw import router as raw_router
+
+    # Mount both back ends side by side in a bare app (no middleware)
+    app = FastAPI()
+    app.include_router(orm_router, prefix="/orm")
+    backends = {"orm": "/orm"}
+
+    if args.database == "sqlite":
+        import tempfile
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        # A throw-away database file; every session gets its own connection,
+        # and concurrent writers wait for SQLite's lock instead of failing
+        database_file = os.path.join(tempfile.mkdtemp(prefix="bench_"), "bench.db")
+        bench_engine = create_async_engine(
+            f"sqlite+aiosqlite:///{database_file}",
+            pool_size=args.concurrency,
+            connect_args={"timeout": 30},
+        )
+        # Only the tables the user routes touch: 'audit_events' is partitioned (PostgreSQL only)
+        async with bench_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[User.__table__, Address.__table__])
+        session_factory = async_sessionmaker(bench_engine, expire_on_commit=False)
+
+        async def sqlite_db():
+            async with session_factory() as session:
+                yield session
+
+        app.dependency_overrides[get_db] = sqlite_db
+        app.dependency_overrides[get_read_db] = sqlite_db
+    else:
+        bench_engine = engine
+        session_factory = AsyncSessionLocal
+        app.include_router(raw_router, prefix="/raw")
+        backends["raw"] = "/raw"
+
+    # The ORM service reads through the user cache, the raw one does not.
+    # Disable it (unless asked otherwise) so both back ends do the same database work.
+    if not args.with_cache:
+        cache.user_cache = LRUCache("user", maxsize=0, ttl=0)
+
+    # Seed throw-away users; removed again at the end (PostgreSQL)
+    async with session_factory() as db:
+        result = await db.execute(
+            insert(User)
+            .values([
+                {"name": "bench", "age": 1, "username": f"bench_{uuid.uuid4().hex}",
+                 "hashed_password": "x", "role": "user"}
+                for _ in range(args.users)
+            ])
+            .returning(User.id)
+        )
+        user_ids = list(result.scalars())
+        await db.commit()
+
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(
+                f"database={args.database} requests={args.requests} concurrency={args.concurrency} "
+                f"mix={args.mix} cache={'on' if args.with_cache else 'off'}"
+            )
+            for backend, prefix in backends.items():
+                print_report(backend, await run_backend(client, prefix, args, user_ids))
+    finally:
+        async with session_factory() as db:
+            await db.execute(delete(User).where(User.id.in_(user_ids)))
+            await db.commit()
+        await close_pool()
+        await bench_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ORM and raw SQL user back ends")
+    parser.add_argument("--database", choices=("postgres", "sqlite"), default="postgres")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per back end")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=1000, help="users seeded for the run")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("get=70,list=20,update=10"))
+    parser.add_argument("--seed", type=int, default=42, help="random seed, for reproducible runs")
+    parser.add_argument("--with-cache", action="store_true", help="keep the ORM user cache enabled")
+    args = parser.parse_args()
+
+    if args.database == "sqlite":
+        # The app's Settings require these; their values do not matter for SQLite
+        for name, value in {
+            "DB_HOST": "localhost", "DB_PORT": "5432", "DB_NAME": "bench", "DB_USER": "bench",
+            "DB_PASSWORD": "bench", "MINIO_ENDPOINT": "localhost:9000",
+            "MINIO_ACCESS_KEY": "bench", "MINIO_SECRET_KEY": "bench",
+        }.items():
+            os.environ.setdefault(name, value)
+
+    asyncio.run(main(args))
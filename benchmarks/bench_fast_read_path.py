@@ -0,0 +1,105 @@
+# CPU time and memory per row of the two ways to serve a page of users:
+#   orm   -> select(User) builds ORM objects, which are validated into Page[UserResponse]
+#            and encoded by Pydantic (what FastAPI does for a route with a response_model)
+#   rows  -> select(User.id, User.name, User.age, User.version) builds plain dicts,
+#            which are encoded as they are (app.core.responses.dumps_json, orjson if installed)
+#
+# Both variants run the same query on the same rows. The rows are inserted inside a
+# transaction that is rolled back at the end, so the users table is left untouched.
+#
+# Needs PostgreSQL (uses the app's normal .env / environment variables). Run from the project root:
+#
+#   python -m benchmarks.bench_fast_read_path --rows 10000 100000
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+
+from pydantic import TypeAdapter
+from sqlalchemy import text
+
+from app.core.responses import dumps_json, orjson
+from app.db.session import AsyncSessionLocal, engine
+from app.schemas.common import Page
+from app.schemas.user_response import UserResponse
+from app.services.user_service import _load_users_page, _load_users_rows
+
+PAGE_ADAPTER = TypeAdapter(Page[UserResponse])
+
+SEED_SQL = """
+    INSERT INTO users (name, age, username, hashed_password, role)
+    SELECT 'bench user ' || g, g % 90, 'bench_fast_read_' || g, 'x', 'user'
+    FROM generate_series(1, :rows) AS g
+"""
+
+
+async def serve_orm(db, after_id: int, rows: int) -> bytes:
+    page = await _load_users_page(db, after_id, rows, include_total=False)
+    return PAGE_ADAPTER.dump_json(PAGE_ADAPTER.validate_python(page, from_attributes=True))
+
+
+async def serve_rows(db, after_id: int, rows: int) -> bytes:
+    page = await _load_users_rows(db, after_id, rows, include_total=False)
+    return dumps_json(page)
+
+
+VARIANTS = {"orm": serve_orm, "rows": serve_rows}
+
+
+async def measure(db, serve, after_id: int, rows: int, rounds: int) -> dict:
+    """ Median seconds and peak traced memory for serving one page of 'rows' rows. """
+
+    seconds = []
+    for _ in range(rounds):
+        started_at = time.perf_counter()
+        body = await serve(db, after_id, rows)
+        seconds.append(time.perf_counter() - started_at)
+        # Every request has a new session; don't let ORM objects pile up in this one
+        db.expunge_all()
+
+    # A separate run for memory: tracing allocations slows everything down
+    tracemalloc.start()
+    await serve(db, after_id, rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.expunge_all()
+
+    return {"seconds": statistics.median(seconds), "peak": peak, "bytes": len(body)}
+
+
+async def main(args):
+    print(f"JSON encoder for 'rows': {'orjson' if orjson is not None else 'json (stdlib)'}")
+    async with AsyncSessionLocal() as db:
+        # Only the rows inserted below are read (they all come after the current maximum ID)
+        after_id = (await db.execute(text("SELECT coalesce(max(id), 0) FROM users"))).scalar_one()
+        await db.execute(text(SEED_SQL), {"rows": max(args.rows)})
+
+        try:
+            for rows in args.rows:
+                # Warm up (statement caches, first-use imports)
+                for serve in VARIANTS.values():
+                    await serve(db, after_id, min(rows, 100))
+                    db.expunge_all()
+
+                results = {name: await measure(db, serve, after_id, rows, args.rounds) for name, serve in VARIANTS.items()}
+                print(f"\nrows={rows} rounds={args.rounds} (median per page)")
+                print(f"  {'variant':<8}{'ms/page':>10}{'us/row':>9}{'peak MB':>10}{'bytes/row':>11}{'body MB':>9}")
+                for name, result in results.items():
+                    print(
+                        f"  {name:<8}{result['seconds'] * 1e3:>10.1f}{result['seconds'] / rows * 1e6:>9.2f}"
+                        f"{result['peak'] / 1e6:>10.1f}{result['peak'] / rows:>11.0f}{result['bytes'] / 1e6:>9.2f}"
+                    )
+                orm, fast = results["orm"], results["rows"]
+                print(f"  rows vs orm: {orm['seconds'] / fast['seconds']:.1f}x faster, {orm['peak'] / fast['peak']:.1f}x less peak memory")
+        finally:
+            # Leave the table exactly as it was
+            await db.rollback()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the ORM and fast (column) read paths for GET /users/")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000], help="page sizes to measure")
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
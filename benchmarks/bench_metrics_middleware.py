@@ -0,0 +1,107 @@
+# Per-request overhead of app.core.http_metrics.MetricsMiddleware.
+#
+# A trivial ASGI app (it "routes" the request and sends an empty 200) is called
+# directly, with no server and no HTTP client, so the only difference between the
+# variants is the middleware itself:
+#   bare            -> the app on its own
+#   metrics         -> wrapped in MetricsMiddleware (pure ASGI)
+#   basehttp        -> wrapped in an empty '@app.middleware("http")'-style BaseHTTPMiddleware,
+#                      for comparison with the way request logging is built
+#
+# No database or environment variables are needed. Run from the project root:
+#
+#   python -m benchmarks.bench_metrics_middleware --requests 200000
+import argparse
+import asyncio
+import statistics
+import time
+
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.http_metrics import MetricsMiddleware
+
+
+class FakeRoute:
+    """ Stands in for the APIRoute that FastAPI's router puts in the scope. """
+
+    path = "/users/{user_id}"
+
+
+ROUTE = FakeRoute()
+
+
+async def bare_app(scope, receive, send):
+    # What the router does on a match: remember the route in the shared scope
+    scope["route"] = ROUTE
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def pass_through(request, call_next):
+    return await call_next(request)
+
+
+def make_scope() -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/users/42",
+        "raw_path": b"/users/42",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+
+
+async def time_variant(app, requests: int) -> float:
+    """ Return the average seconds per request for one variant. """
+
+    started_at = time.perf_counter()
+    for _ in range(requests):
+        await app(make_scope(), receive, send)
+    return (time.perf_counter() - started_at) / requests
+
+
+async def main(args):
+    variants = {
+        "bare": bare_app,
+        "metrics": MetricsMiddleware(bare_app),
+        "basehttp": BaseHTTPMiddleware(bare_app, dispatch=pass_through),
+    }
+
+    # Warm up (first calls create the metric label entries)
+    for app in variants.values():
+        await time_variant(app, 1000)
+
+    # Several rounds, reporting the median, to smooth out noise
+    results = {name: [] for name in variants}
+    for _ in range(args.rounds):
+        for name, app in variants.items():
+            results[name].append(await time_variant(app, args.requests))
+
+    bare = statistics.median(results["bare"])
+    print(f"requests={args.requests} rounds={args.rounds} (median per request)")
+    print(f"  {'variant':<10}{'us/request':>12}{'overhead us':>13}")
+    for name, values in results.items():
+        per_request = statistics.median(values)
+        print(f"  {name:<10}{per_request * 1e6:>12.2f}{(per_request - bare) * 1e6:>13.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the per-request cost of the metrics middleware")
+    parser.add_argument("--requests", type=int, default=100000, help="requests per variant and round")
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,175 @@
+# Latency comparison of the user_service write paths:
+# the old "SELECT first, then write, then refresh" versions (kept below as legacy_*)
+# against the single-statement UPDATE/DELETE/INSERT ... RETURNING versions.
+#
+# Needs the same .env / environment variables as the app (it uses app.db.session).
+# Run from the project root:
+#
+#   python -m benchmarks.bench_write_paths --iterations 500
+#
+# Rows created by the benchmark use the username prefix "bench_" and are removed at the end.
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from sqlalchemy import delete, event, insert, select
+
+from app.db.session import AsyncSessionLocal, engine
+from app.models.user import User
+from app.schemas.user_request import UserRegister, UserUpdate
+from app.services import user_service
+
+
+# --- Legacy implementations (copied from user_service before the rewrite) ---
+
+async def legacy_update_user(db, user_id: int, user: UserUpdate):
+    result = await db.execute(select(User).where(User.id == user_id))
+    existing_user = result.scalar_one_or_none()
+    if not existing_user:
+        return None
+    existing_user.name = user.name
+    existing_user.age = user.age
+    await db.commit()
+    await db.refresh(existing_user)
+    return existing_user
+
+
+async def legacy_delete_user(db, user_id: int) -> bool:
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
+    if not user:
+        return False
+    await db.delete(user)
+    await db.commit()
+    return True
+
+
+async def legacy_register_user(db, user_data):
+    result = await db.execute(select(User).where(User.username == user_data.username))
+    if result.scalar_one_or_none():
+        raise ValueError("Username already exists")
+    new_user = User(
+        username=user_data.username,
+        hashed_password=await user_service.hash_password_async(user_data.password),
+        role="user",
+        name=user_data.name,
+        age=user_data.age
+    )
+    db.add(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    return new_user
+
+
+# --- Statement counter: how many SQL statements each call sends to PostgreSQL ---
+statement_count = 0
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    global statement_count
+    statement_count += 1
+
+
+async def seed_users(count: int) -> list[int]:
+    """ Create 'count' throw-away users and return their IDs. """
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            insert(User)
+            .values([
+                {"name": "bench", "age": 1, "username": f"bench_{uuid.uuid4().hex}",
+                 "hashed_password": "x", "role": "user"}
+                for _ in range(count)
+            ])
+            .returning(User.id)
+        )
+        ids = list(result.scalars())
+        await db.commit()
+        return ids
+
+
+async def time_calls(label: str, impl: str, call, args_list) -> dict:
+    """ Run 'call' once per args tuple, each in a fresh session, and collect timings. """
+
+    global statement_count
+    timings = []
+    statements_before = statement_count
+    for args in args_list:
+        async with AsyncSessionLocal() as db:
+            start = time.perf_counter()
+            try:
+                await call(db, *args)
+            except ValueError:
+                pass # "Username already exists" is an expected outcome for the conflict case
+            timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        "operation": label,
+        "impl": impl,
+        "mean_ms": statistics.fmean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+        "statements": (statement_count - statements_before) / len(args_list),
+    }
+
+
+def register_payloads(count: int, taken: str | None = None) -> list[tuple]:
+    return [
+        (UserRegister(username=taken or f"bench_{uuid.uuid4().hex}", password="secret123", name="bench", age=1),)
+        for _ in range(count)
+    ]
+
+
+async def main(iterations: int):
+    # bcrypt would take ~100x longer than the database work we want to compare,
+    # so both register implementations get the same cheap stand-in.
+    async def cheap_hash(password: str) -> str:
+        return "x"
+
+    user_service.hash_password_async = cheap_hash
+
+    results = []
+
+    # UPDATE: same rows, alternating values
+    ids = await seed_users(iterations)
+    change = UserUpdate(name="bench-updated", age=2)
+    results.append(await time_calls("update", "legacy", legacy_update_user, [(i, change) for i in ids]))
+    results.append(await time_calls("update", "returning", user_service.update_user, [(i, change) for i in ids]))
+
+    # DELETE: each implementation deletes its own freshly seeded rows
+    ids = await seed_users(iterations)
+    results.append(await time_calls("delete", "legacy", legacy_delete_user, [(i,) for i in ids]))
+    ids = await seed_users(iterations)
+    results.append(await time_calls("delete", "returning", user_service.delete_user, [(i,) for i in ids]))
+
+    # REGISTER: new usernames, then the "username already taken" path
+    results.append(await time_calls("register", "legacy", legacy_register_user, register_payloads(iterations)))
+    results.append(await time_calls("register", "on_conflict", user_service.register_user, register_payloads(iterations)))
+    taken = register_payloads(1)[0][0].username
+    async with AsyncSessionLocal() as db:
+        await user_service.register_user(db, register_payloads(1, taken)[0][0])
+    results.append(await time_calls("register-taken", "legacy", legacy_register_user, register_payloads(iterations, taken)))
+    results.append(await time_calls("register-taken", "on_conflict", user_service.register_user, register_payloads(iterations, taken)))
+
+    # Clean up everything we created
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(User).where(User.username.like("bench\\_%")))
+        await db.commit()
+    await engine.dispose()
+
+    print(f"{'operation':<16}{'impl':<13}{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'stmts/op':>10}")
+    for r in results:
+        print(
+            f"{r['operation']:<16}{r['impl']:<13}{r['mean_ms']:>9.3f}{r['p50_ms']:>9.3f}"
+            f"{r['p95_ms']:>9.3f}{r['statements']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare legacy and single-statement user writes")
+    parser.add_argument("--iterations", type=int, default=200)
+    asyncio.run(main(parser.parse_args().iterations))
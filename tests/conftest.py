@@ -0,0 +1,50 @@
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+
+# The settings require database and MinIO credentials. Most tests never connect;
+# those that need PostgreSQL use 'postgres_schema' and are skipped without one.
+for name, value in {
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_NAME": "test",
+    "DB_USER": "test",
+    "DB_PASSWORD": "test",
+    "MINIO_ENDPOINT": "localhost:9000",
+    "MINIO_ACCESS_KEY": "test",
+    "MINIO_SECRET_KEY": "test",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@asynccontextmanager
+async def postgres_schema():
+    """
+    An engine whose connections work in a fresh, empty schema (dropped afterwards),
+    so tests never touch the application's own tables. Skips the test without PostgreSQL.
+    """
+
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.db.session import DATABASE_URL
+
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    admin = create_async_engine(DATABASE_URL, connect_args={"timeout": 2})
+    try:
+        async with admin.begin() as conn:
+            await conn.execute(text(f"CREATE SCHEMA {schema}"))
+    except Exception as exc:
+        await admin.dispose()
+        pytest.skip(f"PostgreSQL is not available: {exc}")
+
+    engine = create_async_engine(DATABASE_URL, connect_args={"server_settings": {"search_path": schema}})
+    try:
+        yield engine
+    finally:
+        await engine.dispose()
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        await admin.dispose()
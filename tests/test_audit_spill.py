@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+from app.services.audit_service import AuditPipeline
+
+
+def _pipeline(tmp_path, **kwargs) -> AuditPipeline:
+    options = dict(
+        maxsize=10, batch_size=2, flush_interval=0.01, overflow_policy="spill", spill_path=str(tmp_path / "audit.spill")
+    )
+    options.update(kwargs)
+    return AuditPipeline(**options)
+
+
+def _event_line(action: str) -> str:
+    return json.dumps({"created_at": "2030-06-15T10:00:00+00:00", "action": action, "actor": "alice", "details": "x"})
+
+
+def test_replay_skips_unreadable_lines_and_keeps_them_aside(tmp_path):
+    pipeline = _pipeline(tmp_path)
+    saved = []
+
+    async def save(batch, spill_on_error=True):
+        saved.extend(event["action"] for event in batch)
+        return True
+
+    pipeline._save = save
+    # The second line was cut off by a crash in the middle of a write
+    lines = [_event_line("A"), _event_line("B")[:20], _event_line("C"), "[1, 2]", _event_line("D")]
+    (tmp_path / "audit.spill").write_text("\n".join(lines) + "\n")
+
+    asyncio.run(pipeline._replay_spill())
+
+    assert saved == ["A", "C", "D"]
+    assert not (tmp_path / "audit.spill").exists()
+    assert not (tmp_path / "audit.spill.replay").exists()
+    assert (tmp_path / "audit.spill.bad").read_text().splitlines() == [lines[1], lines[3]]
+
+
+def test_restarting_a_dead_writer_keeps_the_queued_events(tmp_path):
+    pipeline = _pipeline(tmp_path, overflow_policy="block")
+    saved = []
+
+    async def save(batch, spill_on_error=True):
+        saved.extend(event["action"] for event in batch)
+        return True
+
+    async def main():
+        pipeline.start()
+        # The writer dies; an event is queued before anyone notices
+        pipeline._writer.cancel()
+        await asyncio.sleep(0)
+        await pipeline._queue.put({"created_at": None, "action": "QUEUED", "actor": None, "details": ""})
+
+        pipeline._save = save
+        await pipeline.log("NEXT", "y")
+        await pipeline.stop()
+
+    asyncio.run(main())
+
+    assert saved == ["QUEUED", "NEXT"]
@@ -0,0 +1,64 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.security import verify_password
+from app.db.base import Base
+from app.db.session import get_db
+from app.models.address import Address
+from app.models.user import User
+from app.routers import users
+from conftest import postgres_schema
+
+
+def test_bulk_create_saves_valid_items_and_reports_the_others():
+    items = [
+        {"name": "Ann", "age": 30, "username": "ann", "password": "secret1"},
+        {"name": "Bob", "age": -1, "username": "bob", "password": "secret1"},     # invalid age
+        {"name": "Cid", "age": 40, "username": "taken", "password": "secret1"},   # already in the table
+        {"name": "Dee", "age": 50, "username": "dee", "password": "secret1"},
+        {"name": "Ann2", "age": 31, "username": "ann", "password": "secret1"},    # repeated in the request
+        {"name": "Eve", "age": 22},                                               # no credentials
+    ]
+
+    async def main():
+        async with postgres_schema() as engine:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all, tables=[User.__table__, Address.__table__])
+                await conn.execute(text(
+                    "INSERT INTO users (name, age, username, hashed_password, role) "
+                    "VALUES ('Old', 60, 'taken', 'x', 'user')"
+                ))
+
+            sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+            async def override_get_db():
+                async with sessions() as session:
+                    yield session
+
+            app = FastAPI()
+            app.include_router(users.router)
+            app.dependency_overrides[get_db] = override_get_db
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post("/users/bulk", json=items)
+
+            async with sessions() as session:
+                saved = (await session.execute(select(User).order_by(User.id))).scalars().all()
+            return response, saved
+
+    response, saved = asyncio.run(main())
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [user["name"] for user in body["created"]] == ["Ann", "Dee"]
+    assert [error["index"] for error in body["errors"]] == [1, 2, 4, 5]
+    assert body["errors"][1]["errors"][0]["msg"] == "Username already exists"
+
+    assert [user.username for user in saved] == ["taken", "ann", "dee"]
+    assert all(user.role == "user" for user in saved)
+    assert verify_password("secret1", saved[1].hashed_password)
@@ -0,0 +1,31 @@
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.rate_limit import TokenBucketLimiter
+from app.routers.auth import client_ip
+
+
+def _request(peer: str, forwarded: str | None = None) -> Request:
+    headers = [] if forwarded is None else [(b"x-forwarded-for", forwarded.encode())]
+    return Request({"type": "http", "client": (peer, 50000), "headers": headers})
+
+
+def test_refunded_attempts_do_not_use_up_the_bucket():
+    limiter = TokenBucketLimiter(limit=2, period_seconds=60, max_keys=10)
+    for _ in range(5):
+        assert limiter.hit("alice") == 0
+        limiter.refund("alice")
+    limiter.hit("alice")
+    limiter.hit("alice")
+    assert limiter.hit("alice") > 0
+
+
+def test_forwarded_address_is_used_only_behind_a_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(settings, "login_trusted_proxies", ["10.0.0.1", "10.0.0.2"])
+
+    # Straight from a client: a forged header is ignored
+    assert client_ip(_request("203.0.113.9", "198.51.100.1")) == "203.0.113.9"
+    # Through our two proxies: the last address that is not one of them
+    assert client_ip(_request("10.0.0.1", "198.51.100.1, 203.0.113.7, 10.0.0.2")) == "203.0.113.7"
+    # A trusted proxy that forwarded no address
+    assert client_ip(_request("10.0.0.1")) == "10.0.0.1"
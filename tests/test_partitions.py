@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db import partitions
+from conftest import postgres_schema
+
+AUDIT_EVENTS_SQL = """
+    CREATE TABLE audit_events (
+        id BIGSERIAL,
+        created_at TIMESTAMPTZ NOT NULL,
+        action VARCHAR NOT NULL,
+        actor VARCHAR,
+        details VARCHAR NOT NULL,
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at)
+"""
+
+
+async def _partition_names(conn) -> list[str]:
+    return sorted((await partitions.list_partitions(conn)).values())
+
+
+def test_maintenance_creates_missing_months_and_drops_expired_ones(monkeypatch):
+    monkeypatch.setattr(settings, "audit_partition_months_ahead", 2)
+    monkeypatch.setattr(settings, "audit_retention_months", 12)
+    now = datetime(2030, 6, 15, tzinfo=timezone.utc)
+
+    async def main():
+        async with postgres_schema() as engine:
+            monkeypatch.setattr(partitions, "engine", engine)
+            async with engine.begin() as conn:
+                await conn.execute(text(AUDIT_EVENTS_SQL))
+                await conn.execute(text("CREATE TABLE audit_events_default PARTITION OF audit_events DEFAULT"))
+                # This month exists; the next two do not; one is past the retention
+                for month, upper in (("2030-06-01", "2030-07-01"), ("2029-01-01", "2029-02-01")):
+                    name = f"audit_events_y{month[:4]}m{month[5:7]}"
+                    await conn.execute(text(
+                        f"CREATE TABLE {name} PARTITION OF audit_events FOR VALUES FROM ('{month}') TO ('{upper}')"
+                    ))
+                # Events that arrived before their month had a partition, and one long expired
+                await conn.execute(text(
+                    "INSERT INTO audit_events (created_at, action, details) VALUES "
+                    "('2030-07-04T00:00:00Z', 'A', 'july'), ('2028-03-01T00:00:00Z', 'A', 'expired')"
+                ))
+
+            result = await partitions.maintain_audit_partitions(now=now)
+
+            assert result == {
+                "created": ["audit_events_y2030m07", "audit_events_y2030m08"],
+                "dropped": ["audit_events_y2029m01"],
+            }
+            async with engine.connect() as conn:
+                assert await _partition_names(conn) == [
+                    "audit_events_y2030m06", "audit_events_y2030m07", "audit_events_y2030m08",
+                ]
+                # The early event moved into its month; the expired one is gone
+                july = await conn.execute(text("SELECT details FROM audit_events_y2030m07"))
+                assert july.scalars().all() == ["july"]
+                left = await conn.execute(text("SELECT count(*) FROM audit_events_default"))
+                assert left.scalar() == 0
+
+            # Nothing left to do the second time
+            assert await partitions.maintain_audit_partitions(now=now) == {"created": [], "dropped": []}
+
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+from app.core.cache import invalidate_user
+from app.core.response_cache import TAGS_SCOPE_KEY, ResponseCache, ResponseCacheMiddleware, _Entry, response_cache
+from app.db import session
+
+
+def _entry(body: bytes, *tags: str) -> _Entry:
+    return _Entry(time.monotonic() + 60, 200, [], body, None, list(tags), None)
+
+
+def test_purge_tags_without_stored_responses():
+    cache = ResponseCache(max_bytes=1000, ttl=60)
+    cache.purge_tags("user:1", "users")
+    assert cache.purges == 1
+
+
+def test_purge_tags_drops_tagged_responses_only():
+    cache = ResponseCache(max_bytes=1000, ttl=60)
+    cache.set(("/users/1", b""), _entry(b"one", "user:1"))
+    cache.set(("/users/2", b""), _entry(b"two", "user:2"))
+    cache.set(("/users/", b""), _entry(b"page", "users"))
+
+    cache.purge_tags("user:1", "users")
+
+    assert cache.get(("/users/1", b"")) is None
+    assert cache.get(("/users/", b"")) is None
+    assert cache.get(("/users/2", b"")).body == b"two"
+
+
+def test_invalidate_user_whose_response_was_never_cached():
+    response_cache.clear()
+    purges_before = response_cache.purges
+
+    # What every write (create, bulk, register, update, delete) does after its commit
+    asyncio.run(invalidate_user(424242))
+
+    assert response_cache.purges == purges_before + 1
+
+
+def _route(tags=None, read_engine=None):
+    """ A bare ASGI app that answers 200 and marks itself like 'cached'/'get_read_db' would. """
+
+    async def app(scope, receive, send):
+        if tags is not None:
+            scope[TAGS_SCOPE_KEY] = tags
+        if read_engine is not None:
+            scope[session.READ_ENGINE_SCOPE_KEY] = read_engine
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"body"})
+
+    return app
+
+
+def _get(app, path: str, cookie: bytes | None = None) -> list[dict]:
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": []}
+    if cookie is not None:
+        scope["headers"].append((b"cookie", cookie))
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(ResponseCacheMiddleware(app)(scope, receive, send))
+    return sent
+
+
+def test_responses_of_routes_that_did_not_opt_in_are_not_stored():
+    response_cache.clear()
+    sent = _get(_route(), "/plain")
+    assert sent[1]["body"] == b"body"
+    assert response_cache.get(("/plain", b"")) is None
+
+
+def test_replica_responses_are_stored_only_while_the_replica_keeps_up(monkeypatch):
+    replica = object()
+    lag = 0.2
+
+    async def lag_seconds(engine):
+        return lag
+
+    monkeypatch.setattr(session.replica_set, "lag_seconds", lag_seconds)
+    monkeypatch.setattr(session.settings, "response_cache_max_replica_lag_seconds", 1)
+    response_cache.clear()
+
+    _get(_route(["users"], session.engine), "/primary")
+    _get(_route(["users"], replica), "/fresh")
+    _get(_route(["users"], replica), "/wrote", cookie=b"db_last_write=1")
+    lag = 5
+    _get(_route(["users"], replica), "/behind")
+
+    assert response_cache.get(("/primary", b"")) is not None
+    assert response_cache.get(("/fresh", b"")) is not None
+    assert response_cache.get(("/wrote", b"")) is None
+    assert response_cache.get(("/behind", b"")) is None
@@ -0,0 +1,48 @@
+import asyncio
+
+from app.core.cache import invalidate_user
+from app.core.singleflight import SingleFlight, reads
+
+
+def test_followers_share_the_leaders_result():
+    flight = SingleFlight()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do(("users.get_user", 1, None), load) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(calls) == 1
+
+
+def test_write_forgets_user_and_list_reads_in_flight():
+    async def main():
+        release = asyncio.Event()
+
+        async def load():
+            await release.wait()
+            return "before the write"
+
+        keys = [
+            ("users.get_user", 7, None),
+            ("users_raw.get_user", 7, ("name",)),
+            ("users.list", "primary", False, None, 50, False),
+            ("users_raw.list", None, False, None, 50, False),
+        ]
+        other_user = ("users.get_user", 8, None)
+        tasks = [asyncio.create_task(reads.do(key, load)) for key in [*keys, other_user]]
+        await asyncio.sleep(0)
+
+        await invalidate_user(7)
+        # Requests arriving now start fresh reads instead of joining the old ones
+        assert list(reads._calls) == [other_user]
+
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
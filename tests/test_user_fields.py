@@ -0,0 +1,18 @@
+import pytest
+
+from app.schemas.user_response import parse_user_fields
+
+
+def test_fields_are_returned_in_schema_order():
+    assert parse_user_fields(" name, id ,name") == ("id", "name")
+
+
+def test_missing_or_blank_fields_mean_every_field():
+    assert parse_user_fields(None) is None
+    assert parse_user_fields("  ") is None
+
+
+@pytest.mark.parametrize("fields", [",", " , ,", "email", "id,email"])
+def test_empty_or_unknown_fields_are_rejected(fields):
+    with pytest.raises(ValueError):
+        parse_user_fields(fields)